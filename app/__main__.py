@@ -0,0 +1,95 @@
+"""
+多进程启动器
+在父进程中读取配置并创建表结构，再由 uvicorn 派生多个工作进程；工作进程使用同一份配置快照启动，跳过建表。
+配置快照写入只有当前用户可读的临时文件，退出时删除
+
+python -m app                       # 使用配置文件中 server 的设置
+python -m app --workers 4 --port 8080
+python -m app --rebuild-search-index  # 对 SQLite 数据库执行 VACUUM 后重建全文索引
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+import uvicorn
+
+from app.data import app_data
+from app.error.database import UnsupportedDatabaseError
+from app.logger import logger
+from app.model import constants
+from app.model.data import Config, DatabaseManager
+from app.util.file import load_config, new_empty_config
+
+
+async def _prepare_database(config: Config, rebuild_search: bool = False):
+    from app.main import create_schema
+    from app.model.search import rebuild_search_index
+
+    database = config.database
+    if database.type not in constants.DB_PATH:
+        raise UnsupportedDatabaseError(database.type)
+    db = DatabaseManager(database.url or constants.DB_PATH[database.type], database)
+    try:
+        await create_schema(db)
+        if rebuild_search:
+            async with db.engine.begin() as conn:
+                await conn.run_sync(rebuild_search_index)
+            logger.info("全文索引已重建")
+    finally:
+        # 工作进程各自创建连接池，父进程的连接不能被继承
+        await db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app", description="Raven Client 多进程启动器")
+    parser.add_argument("--host", help="监听地址，默认使用 server.host")
+    parser.add_argument("--port", type=int, help="监听端口，默认使用 server.port")
+    parser.add_argument("--workers", type=int, help="工作进程数，0 表示与 CPU 核数相同，默认使用 server.workers")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument(
+        "--rebuild-search-index", action="store_true",
+        help="启动前重建 SQLite 全文索引，对数据库执行 VACUUM 后需要使用"
+    )
+    args = parser.parse_args()
+
+    try:
+        config = load_config()
+    except FileNotFoundError:
+        new_empty_config(app_data)
+        config = app_data.config
+
+    server = config.server
+    workers = server.workers if args.workers is None else args.workers
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        if server.store != "redis":
+            logger.warning("server.store 为 memory，消息顺序号与结果缓存不会在工作进程之间共享")
+        if config.ratelimit.enabled and config.ratelimit.store != "redis":
+            logger.warning("ratelimit.store 为 memory，限流额度按工作进程分别计算")
+        if config.reload.enabled:
+            logger.warning("各工作进程分别热加载配置文件，修改后可能短暂不一致")
+
+    asyncio.run(_prepare_database(config, args.rebuild_search_index))
+
+    # mkstemp 创建的文件权限为 0600
+    fd, snapshot = tempfile.mkstemp(prefix="raven-config-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(config.model_dump_json())
+        os.environ[constants.CONFIG_SNAPSHOT_ENV] = snapshot
+        os.environ[constants.SCHEMA_READY_ENV] = "1"
+
+        uvicorn.run(
+            "app.main:app",
+            host=args.host or server.host,
+            port=args.port or server.port,
+            workers=workers,
+            log_level=args.log_level
+        )
+    finally:
+        os.unlink(snapshot)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,137 @@
-from typing import Dict
+import asyncio
+from typing import Any, Dict, List, Optional
 
-from app.main import app_data
+from aiohttp import ClientError, ClientSession
+from pydantic import BaseModel
 
-url = "https://api.wolframalpha.com/v2/query"
+from app.data import app_data
+from app.error.llm import UpstreamError
+from app.llm.coalesce import SingleFlight
+from app.logger import logger
+from app.model.data import Wolfram
+from app.util.cache import TTLCache
+from app.util.serializer import loads
 
-async def query(params: Dict[str, str]):
-    res = await app_data.client.get(url, params=params)
+URL = "https://api.wolframalpha.com/v2/query"
+
+
+class Pod(BaseModel):
+    id: str = ""
+    title: str = ""
+    text: List[str] = []
+
+
+class WolframResult(BaseModel):
+    input: str
+    success: bool
+    pods: List[Pod] = []
+    error: Optional[str] = None
+
+    def text(self) -> str:
+        """ 供 LLM 阅读的纯文本结果 """
+        if not self.success:
+            return f"Wolfram|Alpha 无结果：{self.error or '无法理解该问题'}"
+        return "\n".join(f"{pod.title}: {' | '.join(pod.text)}" for pod in self.pods if pod.text)
+
+
+def normalize_query(text: str) -> str:
+    """ 合并空白并忽略大小写，作为缓存与去重的 key """
+    return " ".join(text.split()).casefold()
+
+
+def parse_result(text: str, data: Dict[str, Any]) -> WolframResult:
+    result = data.get("queryresult") or {}
+    pods = [
+        Pod(
+            id=pod.get("id", ""),
+            title=pod.get("title", ""),
+            text=[subpod["plaintext"] for subpod in pod.get("subpods") or () if subpod.get("plaintext")]
+        )
+        for pod in result.get("pods") or ()
+    ]
+    error = result.get("error")
+    return WolframResult(
+        input=text,
+        success=bool(result.get("success")),
+        pods=pods,
+        error=error.get("msg") if isinstance(error, dict) else None
+    )
+
+
+class WolframClient:
+    """
+    Wolfram|Alpha 查询客户端。
+    结果按规范化后的问题缓存，相同的进行中查询只请求一次，query_many 并发执行一轮对话中的多个工具调用。
+    """
+
+    def __init__(self, app_id: str, settings: Wolfram = Wolfram(), session: Optional[ClientSession] = None):
+        """
+        参数：
+        :param session: 复用的连接池会话，默认在首次查询时创建并由 close 关闭
+        """
+        self.app_id = app_id
+        self.settings = settings
+        self.session = session
+        self._owns_session = session is None
+        self.cache: TTLCache[WolframResult] = TTLCache(settings.cache_size, settings.cache_ttl)
+        self.inflight: SingleFlight[WolframResult] = SingleFlight("wolfram")
+        self.semaphore = asyncio.Semaphore(settings.max_concurrency)
+
+    async def _fetch(self, text: str) -> WolframResult:
+        params = {"appid": self.app_id, "input": text, "output": "json", "format": "plaintext"}
+        if self.session is None:
+            # 全局会话带有固定的 Host 等浏览器请求头，不能用于其他站点
+            self.session = ClientSession()
+        async with self.semaphore:
+            async with self.session.get(URL, params=params) as response:
+                if response.status != 200:
+                    raise UpstreamError(response.status, await response.text())
+                result = parse_result(text, loads(await response.read()))
+        # 网络错误不缓存；Wolfram 明确返回无结果时同样缓存，避免重复查询
+        self.cache.set(normalize_query(text), result)
+        return result
+
+    async def query(self, text: str, timeout: Optional[float] = None) -> WolframResult:
+        """
+        查询单个问题
+        参数：
+        :param timeout: 超时时间（秒），默认使用配置中的 timeout
+        返回：
+        :return: 解析后的结果；网络错误或超时时抛出异常
+        """
+        key = normalize_query(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        # 超时只取消当前调用者的等待，共享的请求仍会完成并写入缓存
+        return await asyncio.wait_for(
+            self.inflight.do(key, lambda: self._fetch(text)),
+            timeout or self.settings.timeout
+        )
+
+    async def query_many(self, texts: List[str], timeout: Optional[float] = None) -> List[WolframResult]:
+        """
+        并发查询多个问题，单个失败或超时不影响其他查询
+        返回：
+        :return: 与 texts 顺序一致的结果，失败的项 success 为 False 并带有 error
+        """
+        async def run(text: str) -> WolframResult:
+            try:
+                return await self.query(text, timeout)
+            except asyncio.TimeoutError:
+                return WolframResult(input=text, success=False, error="查询超时")
+            except (ClientError, UpstreamError, ValueError) as e:
+                logger.error(f"Wolfram|Alpha 查询失败: {str(e)}")
+                return WolframResult(input=text, success=False, error="查询失败")
+
+        return list(await asyncio.gather(*(run(text) for text in texts)))
+
+    async def close(self):
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+async def query(text: str, timeout: Optional[float] = None) -> WolframResult:
+    """ 使用应用的 Wolfram 客户端查询 """
+    return await app_data.wolfram.query(text, timeout)
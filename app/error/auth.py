@@ -0,0 +1,5 @@
+class HasherBusyError(Exception):
+    def __init__(self, pending, message=None):
+        self.pending = pending
+        self.message = message or f"Password hasher is busy ({pending} pending)."
+        super().__init__(self.message)
@@ -0,0 +1,29 @@
+class UpstreamError(Exception):
+    def __init__(self, status: int, body: str = "", message=None):
+        self.status = status
+        self.body = body
+        self.message = message or f"Upstream request failed with status {status}."
+        super().__init__(self.message)
+
+
+class ProviderNotFoundError(Exception):
+    def __init__(self, name, message=None):
+        self.name = name
+        self.message = message or f"Provider '{name}' is not available."
+        super().__init__(self.message)
+
+
+class RequestTooLargeError(Exception):
+    def __init__(self, scope: str, limit: float, message=None):
+        self.scope = scope
+        self.limit = limit
+        self.message = message or f"Request exceeds the token limit of {limit:g} per minute for {scope}."
+        super().__init__(self.message)
+
+
+class RateLimitExceededError(Exception):
+    def __init__(self, scope: str, retry_after: float, message=None):
+        self.scope = scope
+        self.retry_after = retry_after
+        self.message = message or f"Rate limit exceeded for {scope}, retry after {retry_after:.1f}s."
+        super().__init__(self.message)
@@ -1,15 +1,153 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from aiohttp import ClientResponse, ClientSession
+
+from app.error.llm import UpstreamError
+from app.logger import logger
+from app.model.data import Provider
+from app.model.llm import ChatRequest
+from app.util.serializer import dumps, loads
+
+SSE_DATA = b"data:"
+SSE_DONE = b"[DONE]"
+
+
 class OneApi:
-    def __init__(self, config):
-        pass
+    def __init__(self, config: Provider, session: ClientSession):
+        self.config = config
+        self.session = session
+        self.url = f"{config.base_url.rstrip('/')}/chat/completions"
 
-    async def forward(self, request):
+    def _headers(self, stream: bool) -> Dict[str, str]:
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream" if stream else "application/json",
+            "Authorization": f"Bearer {self.config.api_key}",
+        }
+        if self.config.organization_id:
+            headers["OpenAI-Organization"] = self.config.organization_id
+        return headers
+
+    async def _post(self, request: ChatRequest, stream: bool) -> ClientResponse:
+        payload = request.payload(self.config.default_model)
+        payload["stream"] = stream
+        if stream:
+            # 让上游在最后一个 chunk 中返回 token 用量
+            payload.setdefault("stream_options", {"include_usage": True})
+        response = await self.session.post(self.url, headers=self._headers(stream), data=dumps(payload))
+        if response.status != 200:
+            try:
+                body = await response.text()
+            finally:
+                response.release()
+            logger.error(f"API请求失败，状态码：{response.status}")
+            raise UpstreamError(response.status, body)
+        return response
+
+    async def forward(self, request: ChatRequest) -> AsyncIterator[bytes]:
         """ 流式转发 """
-        # TODO
+        response = await self._post(request, stream=True)
+        try:
+            async for chunk in response.content.iter_any():
+                yield chunk
+        finally:
+            response.release()
 
-    async def streaming(self, request):
+    async def streaming(self, request: ChatRequest) -> AsyncIterator[Dict[str, Any]]:
         """ 流式请求 """
-        # TODO
+        response = await self._post(request, stream=True)
+        try:
+            async for line in response.content:
+                chunk = parse_sse_line(line)
+                if chunk is None:
+                    continue
+                if chunk is SSE_DONE:
+                    break
+                yield chunk
+        finally:
+            response.release()
 
-    async def chat(self, request):
+    async def chat(self, request: ChatRequest) -> Dict[str, Any]:
         """ 普通请求 """
-        # TODO
+        response = await self._post(request, stream=False)
+        try:
+            return loads(await response.read())
+        finally:
+            response.release()
+
+
+def parse_sse_line(line: bytes) -> Optional[Any]:
+    """
+    解析一行 SSE 数据。
+    参数：
+    :param line: 上游返回的一行原始字节
+    返回：
+    :return: 解码后的 chunk；流结束时返回 SSE_DONE；注释、空行等返回 None
+    """
+    line = line.strip()
+    if not line.startswith(SSE_DATA):
+        return None
+
+    data = line[len(SSE_DATA):].strip()
+    if data == SSE_DONE:
+        return SSE_DONE
+    return loads(data)
+
+
+class StreamAccumulator:
+    """
+    旁路解析转发中的 SSE 字节流，累计生成内容与 token 用量。
+    只带有用量的行不立即解析，只保留最后一行，读取 usage 时才解析
+    """
+
+    def __init__(self, content: bool = True):
+        """
+        参数：
+        :param content: 是否累计生成内容，只需要用量时不解析内容行
+        """
+        self.collect_content = content
+        self.buffer = b""
+        self.parts: List[str] = []
+        self._usage: Dict[str, int] = {}
+        self._usage_line: Optional[bytes] = None
+        """ 最后一行带有用量、尚未解析的数据 """
+
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def usage(self) -> Dict[str, int]:
+        if self._usage_line is not None:
+            line, self._usage_line = self._usage_line, None
+            try:
+                data = parse_sse_line(line)
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and data.get("usage"):
+                self._usage = data["usage"]
+        return self._usage
+
+    def feed(self, chunk: bytes):
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            # 只解析可能带有内容的行，跳过 role、finish_reason 等
+            if self.collect_content and b'"content"' in line:
+                try:
+                    data = parse_sse_line(line)
+                except ValueError:
+                    continue
+                if data is not None and data is not SSE_DONE:
+                    self.collect(data)
+            elif b'"usage"' in line and b'"usage":null' not in line and b'"usage": null' not in line:
+                self._usage_line = line
+
+    def collect(self, data: Dict[str, Any]):
+        if data.get("usage"):
+            self._usage = data["usage"]
+            self._usage_line = None
+        for choice in data.get("choices") or ():
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                self.parts.append(content)
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from aiohttp import ClientError
+
+from app.error.llm import UpstreamError, ProviderNotFoundError, RateLimitExceededError, RequestTooLargeError
+from app.logger import logger
+from app.model.data import Batch
+from app.model.llm import BatchItem, ChatRequest
+from app.util.metrics import QUEUE_WAIT
+from app.util.ratelimit import TokenBucket
+from app.util.serializer import dumps, loads
+
+ChatCall = Callable[[ChatRequest], Awaitable[Tuple[str, Any]]]
+
+
+class ProviderLimits:
+    """ 每个提供商的并发上限与令牌桶限速，由所有批次共享 """
+
+    def __init__(self, settings: Batch):
+        self.settings = settings
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    @asynccontextmanager
+    async def slot(self, name: str):
+        semaphore = self.semaphores.get(name)
+        if semaphore is None:
+            semaphore = self.semaphores[name] = asyncio.Semaphore(self.settings.provider_concurrency)
+            self.buckets[name] = TokenBucket(self.settings.requests_per_minute / 60, self.settings.burst)
+
+        started = time.perf_counter()
+        async with semaphore:
+            await self.buckets[name].acquire()
+            QUEUE_WAIT.observe(time.perf_counter() - started, queue="batch")
+            yield
+
+
+class BatchRunner:
+    """
+    批量请求执行器。
+    请求并发执行，结果按完成顺序逐条返回，并追加写入 BATCH_DIR/<用户>/<batch_id>.jsonl 以便断点续跑；
+    批次 ID 按用户隔离，不同用户使用相同的 ID 互不影响。
+    """
+
+    def __init__(self, settings: Batch, directory: Path):
+        self.settings = settings
+        self.directory = Path(directory)
+        self.limits = ProviderLimits(settings)
+
+    def _load(self, path: Path) -> Tuple[List[Dict[str, Any]], Set[str]]:
+        """ 读取已成功的结果 """
+        results, done = [], set()
+        if path.exists():
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        result = loads(line)
+                    except ValueError:
+                        continue
+                    if result.get("success") and result["id"] not in done:
+                        done.add(result["id"])
+                        results.append(result)
+        return results, done
+
+    async def _execute(self, item: BatchItem, call: ChatCall) -> Dict[str, Any]:
+        try:
+            provider, data = await call(item.request)
+            return {"id": item.id, "success": True, "provider": provider, "data": data}
+        except (ProviderNotFoundError, UpstreamError, RateLimitExceededError, RequestTooLargeError) as e:
+            error = e.message
+        except (ClientError, asyncio.TimeoutError) as e:
+            error = f"网络请求异常：{str(e)}"
+        except Exception as e:
+            logger.error(f"批量请求 {item.id} 失败: {str(e)}")
+            error = "未知错误"
+        return {"id": item.id, "success": False, "error": error}
+
+    async def run(
+            self,
+            items: List[BatchItem],
+            call: ChatCall,
+            owner: str,
+            batch_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        执行批量请求
+        参数：
+        :param items: 请求列表，id 不能重复
+        :param call: 执行单个请求的协程函数，返回 (提供商名称, 响应)
+        :param owner: 发起批次的用户 ID
+        :param batch_id: 批次 ID，该用户已有同名批次时跳过之前成功的项
+        返回：
+        :return: 按完成顺序产出的结果，先产出之前已成功的结果
+        """
+        batch_id = batch_id or uuid4().hex
+        directory = self.directory / owner
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{batch_id}.jsonl"
+
+        previous, done = await asyncio.to_thread(self._load, path)
+        wanted = {item.id for item in items}
+        for result in previous:
+            if result["id"] in wanted:
+                yield result
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            if item.id not in done:
+                queue.put_nowait(item)
+        pending = queue.qsize()
+        if not pending:
+            return
+
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            while not queue.empty():
+                result = await self._execute(queue.get_nowait(), call)
+                await results.put(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.settings.max_concurrency, pending))]
+        try:
+            with open(path, "ab", buffering=0) as f:
+                for _ in range(pending):
+                    result = await results.get()
+                    f.write(dumps(result) + b"\n")
+                    yield result
+        finally:
+            for task in workers:
+                task.cancel()
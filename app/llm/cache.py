@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.logger import logger
+from app.model.data import Cache
+from app.util.cache import TTLCache, DiskCache
+from app.util.metrics import CACHE_REQUESTS
+from app.util.serializer import dumps, loads
+from app.util.store import SharedStore
+
+
+IGNORED_FIELDS = ("stream", "stream_options", "provider", "session_id", "history", "cache")
+""" 不影响生成结果、不参与缓存 key 的请求字段 """
+
+
+def cache_key(target: Any, payload: Dict[str, Any]) -> str:
+    """
+    对发往提供商的完整请求体做规范化哈希
+    参数：
+    :param target: 解析后的提供商与模型，如 [[名称, 模型], ...]
+    :param payload: 请求体，tools、response_format、stop 等字段均参与计算
+    """
+    data = json.dumps(
+        [target, {key: value for key, value in payload.items() if key not in IGNORED_FIELDS}],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(temperature: Optional[float], cache: Optional[bool] = None) -> bool:
+    """ 显式指定时以指定为准，否则只缓存 temperature 为 0 的确定性请求 """
+    if cache is not None:
+        return cache
+    return temperature == 0
+
+
+class CompletionCache:
+    """ 确定性请求的结果缓存：内存 LRU，可选多进程共享存储与磁盘持久化，依次查找 """
+
+    def __init__(self, settings: Cache, directory: Path, shared: Optional[SharedStore] = None):
+        self.memory: TTLCache[Any] = TTLCache(settings.max_entries, settings.ttl)
+        self.shared = shared
+        self.ttl = settings.ttl
+        self.disk: Optional[DiskCache] = None
+        if settings.disk:
+            self.disk = DiskCache(directory, settings.ttl, settings.disk_max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            data = await self.shared.get("completion:" + key)
+            if data is not None:
+                value = loads(data)
+                self.memory.set(key, value)
+        if value is None and self.disk is not None:
+            data = await asyncio.to_thread(self.disk.get, key)
+            if data is not None:
+                value = loads(data)
+                self.memory.set(key, value)
+
+        if value is None:
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache="completion", result="miss")
+        else:
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="completion", result="hit")
+        return value
+
+    async def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.shared is not None:
+            await self.shared.set("completion:" + key, dumps(value), self.ttl)
+        if self.disk is not None:
+            try:
+                data = dumps(value)
+                await asyncio.to_thread(self.disk.set, key, data)
+            except OSError as e:
+                logger.error(f"写入缓存失败：{str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.memory)}
@@ -0,0 +1,199 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar
+
+from app.util.metrics import COALESCED_REQUESTS
+
+T = TypeVar("T")
+
+StreamResult = Tuple[str, Tuple[bytes, AsyncIterator[bytes]]]
+""" (提供商名称, (首个 chunk, 剩余 chunk)) """
+
+
+class SingleFlight(Generic[T]):
+    """ 合并相同的进行中请求：同一 key 同时只执行一次调用，其余调用者共享其结果或异常 """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.calls: Dict[str, asyncio.Task] = {}
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # 所有调用者都已断开时，避免未读取的异常产生警告
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        task = self.calls.get(key)
+        if task is not None:
+            COALESCED_REQUESTS.inc(kind=self.kind)
+        else:
+            task = self.calls[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda done: self._done(key, done))
+        # 单个调用者被取消不影响其他等待同一结果的调用者
+        return await asyncio.shield(task)
+
+
+class _Broadcast:
+    """
+    一个进行中的上游流。
+    最多保留 buffer 个 chunk，供后加入的订阅者从头读取；超出后丢弃所有订阅者都已读过的 chunk，不再接受新的订阅者
+    """
+
+    def __init__(self, key: str, buffer: int):
+        self.key = key
+        self.buffer = max(1, buffer)
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.chunks: List[bytes] = []
+        self.offset = 0
+        """ 已丢弃的 chunk 数，chunks[0] 的序号 """
+        self.changed = asyncio.Event()
+        self.advanced = asyncio.Event()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers: Set["_Subscription"] = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def lag(self) -> int:
+        """ 最新的 chunk 与最慢的订阅者之间相差的 chunk 数 """
+        head = self.offset + len(self.chunks)
+        return head - min((subscriber.index for subscriber in self.subscribers), default=head)
+
+
+class _Subscription:
+    """ 订阅者读取的迭代器；aclose 可重复调用，没有开始迭代时同样会退出订阅 """
+
+    def __init__(self, coalescer: "StreamCoalescer", broadcast: _Broadcast):
+        self.coalescer = coalescer
+        self.broadcast = broadcast
+        self.index = 1
+        """ 下一个要读取的 chunk 的序号，首个 chunk 由 open 直接返回 """
+        self.closed = False
+        broadcast.subscribers.add(self)
+
+    def __aiter__(self) -> "_Subscription":
+        return self
+
+    async def __anext__(self) -> bytes:
+        broadcast = self.broadcast
+        while not self.closed:
+            if self.index < broadcast.offset + len(broadcast.chunks):
+                chunk = broadcast.chunks[self.index - broadcast.offset]
+                self.index += 1
+                self.coalescer._advance(broadcast)
+                return chunk
+            if broadcast.done:
+                await self.aclose()
+                if broadcast.error is not None:
+                    raise broadcast.error
+                break
+            await broadcast.changed.wait()
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            self.coalescer._leave(self.broadcast, self)
+
+
+class StreamCoalescer:
+    """
+    合并相同的进行中流式请求。
+    第一个请求负责读取上游，后加入的请求先收到已缓冲的 chunk，再接着接收实时数据；
+    按最慢的订阅者读取上游，领先超过 buffer 个 chunk 时暂停；所有订阅者都断开后取消上游请求。
+    """
+
+    def __init__(self):
+        self.streams: Dict[str, _Broadcast] = {}
+
+    async def _pump(self, broadcast: _Broadcast, open_stream: Callable[[], Awaitable[StreamResult]]):
+        stream: Optional[AsyncIterator[bytes]] = None
+        try:
+            name, (first, stream) = await open_stream()
+            broadcast.chunks.append(first)
+            broadcast.ready.set_result(name)
+            broadcast.notify()
+            async for chunk in stream:
+                broadcast.chunks.append(chunk)
+                broadcast.notify()
+                while broadcast.lag() >= broadcast.buffer:
+                    broadcast.advanced.clear()
+                    await broadcast.advanced.wait()
+        except asyncio.CancelledError:
+            broadcast.ready.cancel()
+            raise
+        except Exception as e:
+            broadcast.error = e
+            if not broadcast.ready.done():
+                broadcast.ready.set_exception(e)
+        finally:
+            broadcast.done = True
+            broadcast.notify()
+            self._unlist(broadcast)
+            if stream is not None:
+                await stream.aclose()
+
+    def _unlist(self, broadcast: _Broadcast):
+        if self.streams.get(broadcast.key) is broadcast:
+            del self.streams[broadcast.key]
+
+    def _advance(self, broadcast: _Broadcast):
+        """ 订阅者读取后丢弃超出 buffer、且所有订阅者都已读过的 chunk，并唤醒等待中的上游读取 """
+        passed = min(subscriber.index for subscriber in broadcast.subscribers) - broadcast.offset
+        passed = min(passed, len(broadcast.chunks) - broadcast.buffer)
+        if passed > 0:
+            # 首个 chunk 丢弃后无法再从头重放
+            self._unlist(broadcast)
+            del broadcast.chunks[:passed]
+            broadcast.offset += passed
+        broadcast.advanced.set()
+
+    def _leave(self, broadcast: _Broadcast, subscription: _Subscription):
+        broadcast.subscribers.discard(subscription)
+        if not broadcast.subscribers and not broadcast.done:
+            # 先移除，避免新请求加入一个即将取消的流
+            self._unlist(broadcast)
+            broadcast.task.cancel()
+        elif broadcast.subscribers:
+            self._advance(broadcast)
+
+    async def open(
+            self,
+            key: str,
+            open_stream: Callable[[], Awaitable[StreamResult]],
+            buffer: int = 64
+    ) -> StreamResult:
+        """
+        打开或加入一个流
+        参数：
+        :param key: 请求的规范化哈希
+        :param open_stream: 没有相同的进行中请求时，用于打开上游流的协程函数
+        :param buffer: 上游领先最慢的订阅者的 chunk 数上限
+        返回：
+        :return: 与 open_stream 相同的 (提供商名称, (首个 chunk, 剩余 chunk))；剩余 chunk 必须 aclose
+        """
+        broadcast = self.streams.get(key)
+        if broadcast is None:
+            broadcast = self.streams[key] = _Broadcast(key, buffer)
+            broadcast.task = asyncio.create_task(self._pump(broadcast, open_stream))
+        else:
+            COALESCED_REQUESTS.inc(kind="stream")
+
+        subscription = _Subscription(self, broadcast)
+        try:
+            name = await asyncio.shield(broadcast.ready)
+        except BaseException:
+            await subscription.aclose()
+            raise
+        return name, (broadcast.chunks[0], subscription)
+
+
+completions: SingleFlight = SingleFlight("completion")
+""" 非流式请求的合并 """
+
+streams = StreamCoalescer()
+""" 流式请求的合并 """
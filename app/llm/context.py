@@ -0,0 +1,90 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.model.session import ChatHistory, decode_content
+from app.util.tokens import count_message_tokens
+
+Summarizer = Callable[[List[Dict[str, Any]]], Awaitable[str]]
+
+
+class ContextWindow:
+    """
+    从会话历史中拼接不超过上下文长度的 prompt。
+    每条消息的 token 数缓存在 chat_history.token_count 中，只有新消息需要计数；
+    历史按 (session_id, order) 索引从新到旧分页读取，预算用完即停止。
+    """
+
+    def __init__(self, limit: int, page_size: int = 50, summarize: Optional[Summarizer] = None):
+        """
+        参数：
+        :param limit: 可用于输入的 token 数（上下文长度减去输出预留）
+        :param page_size: 每次从数据库读取的历史条数
+        :param summarize: 可选的摘要函数，被裁剪的较早消息会压缩为一条 system 消息
+        """
+        self.limit = limit
+        self.page_size = page_size
+        self.summarize = summarize
+
+    async def _page(self, session: async_sessionmaker, session_id: str, before: Optional[int]) -> List[ChatHistory]:
+        query = select(ChatHistory).where(ChatHistory.session_id == session_id)  # type: ignore
+        if before is not None:
+            query = query.where(ChatHistory.order < before)
+        query = query.order_by(ChatHistory.order.desc()).limit(self.page_size)
+
+        async with session() as db:
+            rows = list((await db.execute(query)).scalars())
+
+            # 补齐旧数据缺失的 token 数，提交时由 ORM 写回，之后不再重复计算
+            missing = [row for row in rows if row.token_count is None]
+            if missing:
+                for row in missing:
+                    row.token_count = count_message_tokens(decode_content(row))
+                await db.commit()
+        return rows
+
+    async def build(
+            self,
+            session: async_sessionmaker,
+            session_id: str,
+            messages: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        在 messages 前拼接会话历史
+        参数：
+        :param session: 数据库会话工厂
+        :param session_id: 会话 ID
+        :param messages: 本轮新消息，总是完整保留
+        返回：
+        :return: 拼接后的消息列表
+        """
+        budget = self.limit - sum(count_message_tokens(message["content"]) for message in messages)
+        history: List[ChatHistory] = []
+        trimmed: List[ChatHistory] = []
+        before = None
+
+        while budget > 0:
+            rows = await self._page(session, session_id, before)
+            for row in rows:
+                if row.token_count > budget:
+                    budget = 0
+                    trimmed.append(row)
+                    break
+                budget -= row.token_count
+                history.append(row)
+            if budget <= 0 or len(rows) < self.page_size:
+                break
+            before = rows[-1].order
+
+        history.reverse()
+        context = [{"role": row.message_type, "content": decode_content(row)} for row in history]
+
+        if trimmed and self.summarize:
+            older = await self._page(session, session_id, trimmed[0].order + 1)
+            summary = await self.summarize(
+                [{"role": row.message_type, "content": decode_content(row)} for row in reversed(older)]
+            )
+            context.insert(0, {"role": "system", "content": summary})
+
+        return context + messages
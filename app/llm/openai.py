@@ -2,6 +2,9 @@ from typing import Optional
 import aiohttp
 from app.logger import logger
 from app.data import app_data
+from app.llm.cache import cache_key, is_cacheable
+from app.llm.coalesce import completions
+from app.util.serializer import dumps, loads
 
 # Constants for response keys
 RESPONSE_CHOICES = "choices"
@@ -42,7 +45,10 @@ async def post_request(
         api_key: str,
         model_id: str,
         max_tokens: int = 500,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        *,
+        session: aiohttp.ClientSession,
+        cache: Optional[bool] = None
 ) -> Optional[str]:
     """
     调用OpenAI格式API的通用函数
@@ -53,6 +59,8 @@ async def post_request(
     :param model_id: 模型标识符
     :param max_tokens: 生成的最大token数（默认500）
     :param temperature: 生成多样性控制（0-2，默认0.7）
+    :param session: 提供商的连接池会话，如 app_data.pool.get(name)（不会被关闭）
+    :param cache: 是否使用结果缓存，默认只缓存 temperature 为 0 的请求
     返回：
     :return: 生成的文本内容 或 None（发生错误时）
     """
@@ -67,22 +75,38 @@ async def post_request(
         "temperature": temperature
     }
 
-    try:
-        async with app_data.client as session:
-            async with session.post(api_url, headers=headers, json=payload) as response:
+    key = None
+    if is_cacheable(temperature, cache):
+        key = cache_key([api_url, model_id], payload)
+        if app_data.cache:
+            cached = await app_data.cache.get(key)
+            if cached is not None:
+                return cached
+
+    async def send() -> Optional[str]:
+        try:
+            async with session.post(api_url, headers=headers, data=dumps(payload)) as response:
                 # 检查HTTP状态码
                 if response.status != 200:
                     logger.error(f"API请求失败，状态码：{response.status}")
                     return None
 
-                api_response = await response.json()
-                return await validate_response(api_response)
+                api_response = loads(await response.read())
+                content = await validate_response(api_response)
+                if key and app_data.cache and content is not None:
+                    await app_data.cache.set(key, content)
+                return content
+
+        except aiohttp.ClientError as e:
+            logger.error(f"网络请求异常：{str(e)}")
+        except ValueError as e:
+            logger.error(f"JSON解析失败：{str(e)}")
+        except Exception as e:
+            logger.error(f"未知错误：{str(e)}")
 
-    except aiohttp.ClientError as e:
-        logger.error(f"网络请求异常：{str(e)}")
-    except ValueError as e:
-        logger.error(f"JSON解析失败：{str(e)}")
-    except Exception as e:
-        logger.error(f"未知错误：{str(e)}")
+        return None
 
-    return None
+    # 相同的确定性请求同时进行时共享一次上游调用
+    if key and app_data.config and app_data.config.cache.coalesce:
+        return await completions.do(key, send)
+    return await send()
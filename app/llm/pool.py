@@ -0,0 +1,111 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Set, Tuple
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
+
+from app.error.llm import ProviderNotFoundError
+from app.logger import logger
+from app.model.data import HttpClient, Provider
+from app.util.metrics import UPSTREAM_CONNECT
+
+
+def _connect_trace(name: str) -> TraceConfig:
+    """ 记录新建上游连接（DNS、TCP、TLS）的耗时，复用连接时不会触发 """
+    trace = TraceConfig()
+
+    async def on_start(_, context: SimpleNamespace, __):
+        context.connect_started = time.perf_counter()
+
+    async def on_end(_, context: SimpleNamespace, __):
+        UPSTREAM_CONNECT.observe(time.perf_counter() - context.connect_started, provider=name)
+
+    trace.on_connection_create_start.append(on_start)
+    trace.on_connection_create_end.append(on_end)
+    return trace
+
+
+class ClientPool:
+    """ 按提供商划分的长连接池，启动时创建，配置变化时只重建受影响的提供商，关闭应用时统一释放 """
+
+    def __init__(self, default: HttpClient):
+        self.default = default
+        self.sessions: Dict[str, ClientSession] = {}
+        self.settings: Dict[str, Tuple[HttpClient, str]] = {}
+        """ 创建各连接池时使用的 (连接设置, base_url)，用于判断是否需要重建 """
+        self.retired: Set[ClientSession] = set()
+        self._closing: Set[asyncio.Task] = set()
+
+    def _effective(self, provider: Provider) -> Tuple[HttpClient, str]:
+        return provider.http or self.default, provider.base_url
+
+    def _create(self, name: str, provider: Provider) -> ClientSession:
+        settings = provider.http or self.default
+        self.settings[name] = self._effective(provider)
+        connector = TCPConnector(
+            limit=settings.limit,
+            limit_per_host=settings.limit_per_host,
+            keepalive_timeout=settings.keepalive_timeout,
+            ttl_dns_cache=settings.dns_cache_ttl,
+            use_dns_cache=True,
+        )
+        timeout = ClientTimeout(
+            total=None,
+            connect=settings.connect_timeout,
+            sock_read=settings.read_timeout,
+        )
+        return ClientSession(connector=connector, timeout=timeout, trace_configs=[_connect_trace(name)])
+
+    def open(self, providers: Dict[str, Provider]):
+        """ 为所有启用的提供商创建连接池 """
+        for name, provider in providers.items():
+            if provider.enabled and name not in self.sessions:
+                self.sessions[name] = self._create(name, provider)
+                logger.info(f"Connection pool created for provider '{name}'")
+
+    def reload(self, providers: Dict[str, Provider], default: HttpClient, grace: float):
+        """
+        按新配置更新连接池，只重建连接设置或 base_url 变化的提供商。
+        被替换或移除的连接池在 grace 秒后关闭，进行中的请求继续使用原连接池完成。
+        """
+        self.default = default
+        replaced: List[ClientSession] = []
+        for name in list(self.sessions):
+            provider = providers.get(name)
+            if provider is None or not provider.enabled:
+                replaced.append(self.sessions.pop(name))
+                del self.settings[name]
+                logger.info(f"Connection pool removed for provider '{name}'")
+            elif self._effective(provider) != self.settings[name]:
+                replaced.append(self.sessions[name])
+                self.sessions[name] = self._create(name, provider)
+                logger.info(f"Connection pool rebuilt for provider '{name}'")
+        self.open(providers)
+
+        if replaced:
+            self.retired.update(replaced)
+            task = asyncio.create_task(self._close_later(replaced, grace))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _close_later(self, sessions: List[ClientSession], delay: float):
+        await asyncio.sleep(delay)
+        for session in sessions:
+            self.retired.discard(session)
+            await session.close()
+
+    def get(self, name: str) -> ClientSession:
+        session = self.sessions.get(name)
+        if session is None or session.closed:
+            raise ProviderNotFoundError(name)
+        return session
+
+    async def close(self):
+        for task in list(self._closing):
+            task.cancel()
+        for session in [*self.sessions.values(), *self.retired]:
+            await session.close()
+        self.sessions.clear()
+        self.settings.clear()
+        self.retired.clear()
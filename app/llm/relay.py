@@ -0,0 +1,125 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set
+
+from anyio import CancelScope
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.llm import StreamAccumulator
+from app.util.metrics import ACTIVE_STREAMS
+
+_DONE = object()
+""" 上游正常结束的标记 """
+
+_finishing: Set[asyncio.Task] = set()
+""" 进行中的收尾任务，保留引用直到完成 """
+
+
+class RelayResponse(StreamingResponse):
+    """
+    转发上游流的响应。
+    结束、出错或客户端断开后立即关闭 body_iterator（即使还没有开始发送），
+    使其中的收尾逻辑（取消上游请求、记录用量）马上执行，而不是等到被垃圾回收
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
+
+class Relay:
+    """
+    在上游与客户端之间转发 chunk。
+    创建时即由单独的任务读取上游并放入长度为 buffer 的队列，客户端读取变慢时队列写满、暂停读取上游，由 TCP 流量控制向上游施加背压；
+    队列中积压的 chunk 合并为一次写出。无论是否开始迭代，aclose 都会取消读取、关闭上游并调用 on_finish；
+    accumulator 只累计已交给客户端的内容，中途断开时记录的回复不包含仍在队列中的部分
+    """
+
+    def __init__(
+            self,
+            first: bytes,
+            stream: AsyncIterator[bytes],
+            buffer: int,
+            accumulator: Optional[StreamAccumulator] = None,
+            on_finish: Optional[Callable[[bool], Awaitable[None]]] = None,
+            provider: str = ""
+    ):
+        """
+        参数：
+        :param first: 已读取的首个 chunk
+        :param stream: 剩余的上游 chunk，需要支持 aclose
+        :param buffer: 缓冲的 chunk 数上限
+        :param on_finish: 结束时调用，参数为上游是否完整结束
+        """
+        self.first: Optional[bytes] = first
+        self.stream = stream
+        self.accumulator = accumulator
+        self.on_finish = on_finish
+        self.provider = provider
+        self.queue: asyncio.Queue = asyncio.Queue(max(1, buffer))
+        self.end: Optional[object] = None
+        """ 上游结束时为 _DONE 或异常 """
+        self.closed = False
+        ACTIVE_STREAMS.inc(provider=provider)
+        self.reader = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        try:
+            async for chunk in self.stream:
+                await self.queue.put(chunk)
+            await self.queue.put(_DONE)
+        except Exception as e:
+            await self.queue.put(e)
+
+    def __aiter__(self) -> "Relay":
+        return self
+
+    def _deliver(self, chunk: bytes) -> bytes:
+        if self.accumulator:
+            self.accumulator.feed(chunk)
+        return chunk
+
+    async def __anext__(self) -> bytes:
+        if self.first is not None:
+            chunk, self.first = self.first, None
+            return self._deliver(chunk)
+        if self.closed:
+            raise StopAsyncIteration
+
+        item = self.end or await self.queue.get()
+        chunks = []
+        while isinstance(item, bytes):
+            chunks.append(item)
+            item = self.queue.get_nowait() if not self.queue.empty() else None
+        self.end = item
+        if chunks:
+            return self._deliver(b"".join(chunks))
+
+        await self.aclose()
+        if isinstance(item, Exception):
+            raise item
+        raise StopAsyncIteration
+
+    async def _finish(self):
+        # 等读取任务结束后再关闭上游，结算不受请求取消的影响
+        await asyncio.wait([self.reader])
+        await self.stream.aclose()
+        if self.on_finish:
+            await self.on_finish(self.end is _DONE)
+
+    async def aclose(self):
+        if self.closed:
+            return
+        self.closed = True
+        ACTIVE_STREAMS.dec(provider=self.provider)
+        if self.reader.done():
+            await self._finish()
+            return
+        self.reader.cancel()
+        task = asyncio.create_task(self._finish())
+        _finishing.add(task)
+        task.add_done_callback(_finishing.discard)
+        await asyncio.shield(task)
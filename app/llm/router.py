@@ -0,0 +1,198 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from aiohttp import ClientConnectionError
+
+from app.error.llm import UpstreamError, ProviderNotFoundError, RateLimitExceededError, RequestTooLargeError
+from app.logger import logger
+from app.model.data import Provider, Router
+from app.util.metrics import UPSTREAM_ERRORS
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """ 上游尚未返回任何内容的失败才可以安全地切换到备用提供商 """
+    if isinstance(error, UpstreamError):
+        return error.status in RETRYABLE_STATUS
+    return isinstance(error, (ClientConnectionError, asyncio.TimeoutError))
+
+
+class ProviderStats:
+    """ 单个提供商的滑动窗口统计与熔断状态 """
+
+    def __init__(self, settings: Router):
+        self.settings = settings
+        self.latencies: deque = deque(maxlen=settings.window_size)
+        self.outcomes: deque = deque(maxlen=settings.window_size)
+        self.inflight = 0
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._sorted: Optional[List[float]] = None
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        if self._sorted is None:
+            self._sorted = sorted(self.latencies)
+        index = min(len(self._sorted) - 1, int(q * len(self._sorted)))
+        return self._sorted[index]
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(0.5)
+
+    @property
+    def p95(self) -> float:
+        return self.percentile(0.95)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def available(self, now: float) -> bool:
+        if self.state == OPEN and now - self.opened_at >= self.settings.open_seconds:
+            self.state = HALF_OPEN
+            return True
+        if self.state == HALF_OPEN:
+            # 半开状态只放行一个探测请求
+            return self.inflight == 0
+        return self.state == CLOSED
+
+    def score(self) -> float:
+        """ 分数越低越优先：p95 延迟 × 在途请求 ÷ 成功率 """
+        success = max(1.0 - self.error_rate, 0.1)
+        return (self.p95 or self.settings.default_latency) * (1 + self.inflight) / success
+
+    def record(self, latency: float, ok: bool, now: float):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self._sorted = None
+            self.failures = 0
+        else:
+            self.failures += 1
+
+        if self.state == HALF_OPEN:
+            if ok:
+                self._close()
+            else:
+                self._trip(now)
+        elif self.state == CLOSED and self._should_trip():
+            self._trip(now)
+
+    def _should_trip(self) -> bool:
+        settings = self.settings
+        if self.failures >= settings.failure_threshold:
+            return True
+        if len(self.outcomes) >= settings.min_samples:
+            if self.error_rate >= settings.error_rate_threshold:
+                return True
+            if settings.slow_threshold and self.p95 >= settings.slow_threshold:
+                return True
+        return False
+
+    def _trip(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+
+    def _close(self):
+        self.state = CLOSED
+        self.failures = 0
+
+
+class ProviderRouter:
+    """ 按延迟、在途请求数和错误率在多个提供商之间选择，并在失败时切换到备用提供商 """
+
+    def __init__(self, settings: Router):
+        self.settings = settings
+        self.stats: Dict[str, ProviderStats] = {}
+
+    def configure(self, settings: Router):
+        """ 应用新的路由设置，保留已有的统计数据与熔断状态 """
+        self.settings = settings
+        for stats in self.stats.values():
+            stats.settings = settings
+            if stats.latencies.maxlen != settings.window_size:
+                stats.latencies = deque(stats.latencies, maxlen=settings.window_size)
+                stats.outcomes = deque(stats.outcomes, maxlen=settings.window_size)
+                stats._sorted = None
+
+    def _stats(self, name: str) -> ProviderStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ProviderStats(self.settings)
+        return stats
+
+    def candidates(self, providers: Dict[str, Provider], model: Optional[str] = None) -> List[str]:
+        """
+        返回可用提供商，按优先级排序；熔断中的提供商排除在外。
+        只在多个提供商之间选择时按 model 过滤，指定了唯一的提供商时任何模型都原样转发
+        """
+        now = time.monotonic()
+        routing = model is not None and len(providers) > 1
+        names = [
+            name for name, provider in providers.items()
+            if provider.enabled and (not routing or model == provider.default_model or model in provider.models)
+        ]
+        available = [name for name in names if self._stats(name).available(now)]
+        return sorted(available, key=lambda name: self._stats(name).score())
+
+    async def call(
+            self,
+            providers: Dict[str, Provider],
+            attempt: Callable[[str], Awaitable[T]],
+            model: Optional[str] = None
+    ) -> Tuple[str, T]:
+        """
+        选择提供商执行请求，可重试的失败会切换到下一个提供商
+        参数：
+        :param providers: 候选提供商
+        :param attempt: 以提供商名称为参数发起请求的协程函数
+        :param model: 请求指定的模型，只在支持该模型的提供商之间路由
+        返回：
+        :return: (提供商名称, attempt 的返回值)
+        """
+        names = self.candidates(providers, model)
+        if not names:
+            raise ProviderNotFoundError(model)
+
+        error: Optional[BaseException] = None
+        for name in names[:self.settings.max_attempts]:
+            stats = self._stats(name)
+            stats.inflight += 1
+            started = time.monotonic()
+            try:
+                result = await attempt(name)
+            except (RateLimitExceededError, RequestTooLargeError, ProviderNotFoundError) as e:
+                # 本地限流或提供商已被热加载移除，不代表提供商异常，直接尝试下一个
+                error = e
+                continue
+            except Exception as e:
+                UPSTREAM_ERRORS.inc(provider=name, status=getattr(e, "status", type(e).__name__))
+                # 请求本身的错误（如 400）不计入提供商的健康状况
+                if not is_retryable(e):
+                    raise
+                stats.record(0.0, False, time.monotonic())
+                logger.warning(f"Provider '{name}' failed, trying fallback: {str(e)}")
+                error = e
+                continue
+            finally:
+                stats.inflight -= 1
+
+            now = time.monotonic()
+            stats.record(now - started, True, now)
+            return name, result
+
+        raise error
@@ -1,37 +1,133 @@
+import asyncio
+import os
 from contextlib import asynccontextmanager
 
-import toml
-from aiohttp import ClientSession
 from fastapi import FastAPI
 
 from app import route
+from app.api.wolfram import WolframClient
 from app.data import app_data
 from app.error.database import UnsupportedDatabaseError
+from app.llm.batch import BatchRunner
+from app.llm.cache import CompletionCache
+from app.llm.pool import ClientPool
+from app.llm.router import ProviderRouter
 from app.logger import logger
 from app.model import constants
-from app.model import metadata
+from app.model import metadata, add_missing_columns, create_indexes
+from app.model.search import create_search_index, load_search_index
+from app.model.session import message_order, touch_sessions
 from app.model.data import Config, DatabaseManager
-from app.util.file import new_empty_config
-from app.util.auth import generate_password_hash, AuthMiddleware
+from app.model.writer import BatchWriter
+from app.util.file import load_config, new_empty_config
+from app.util.auth import AuthMiddleware, PasswordHasher
+from app.util import metrics
+from app.util.image import ImageCache, ImageProcessor
+from app.util.ratelimit import LocalStore, RateLimiter, RedisStore
+from app.util.serializer import FastJSONResponse
+from app.util.store import LocalSharedStore, RedisSharedStore
+from app.util.watcher import ConfigWatcher
+
+RESTART_REQUIRED = (
+    "database", "security", "history", "cache", "image", "batch", "ratelimit", "wolfram", "reload",
+    "server"
+)
+""" 修改后需要重启才能生效的配置项 """
+
+
+async def reload_config(config: Config):
+    """ 应用热加载的配置：先准备好连接池，再整体替换配置快照，进行中的请求继续使用旧快照与旧连接 """
+    old = app_data.config
+    app_data.pool.reload(config.providers, config.http, config.reload.grace_seconds)
+    app_data.router.configure(config.router)
+    metrics.tracing_enabled = config.metrics.tracing
+    app_data.wolfram.app_id = config.apikey.wolfram
+    app_data.config = config
+
+    changed = [name for name in RESTART_REQUIRED if getattr(old, name) != getattr(config, name)]
+    if changed:
+        logger.warning(f"以下配置修改后需要重启才能生效: {', '.join(changed)}")
+
+
+async def create_schema(db: DatabaseManager):
+    """ 创建表、补齐缺失的列、索引与全文索引；多进程部署时由启动器在派生工作进程前执行一次 """
+    async with db.engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        await conn.run_sync(create_indexes)
+        await conn.run_sync(create_search_index)
+
+
+def _load_config() -> Config:
+    # 由启动器派生的工作进程使用父进程的配置快照，保证所有进程配置一致
+    snapshot = os.environ.get(constants.CONFIG_SNAPSHOT_ENV)
+    if snapshot:
+        with open(snapshot, "rb") as f:
+            return Config.model_validate_json(f.read())
+    return load_config()
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     try:
-        app_data.client = ClientSession(
-            headers=constants.REQUEST_HEADERS
+        config = app_data.config = await asyncio.to_thread(_load_config)
+        metrics.tracing_enabled = config.metrics.tracing
+        app_data.pool = ClientPool(config.http)
+        app_data.pool.open(config.providers)
+        app_data.router = ProviderRouter(config.router)
+        app_data.wolfram = WolframClient(config.apikey.wolfram, config.wolfram)
+        app_data.batch = BatchRunner(config.batch, constants.BATCH_DIR)
+        shared = config.server.store == "redis"
+        app_data.store = RedisSharedStore(config.server.redis_url) if shared else LocalSharedStore()
+        message_order.store = app_data.store
+        if config.ratelimit.enabled:
+            store = RedisStore(config.ratelimit.redis_url) if config.ratelimit.store == "redis" else LocalStore()
+            app_data.limiter = RateLimiter(config.ratelimit, store)
+        if config.cache.enabled:
+            app_data.cache = CompletionCache(
+                config.cache,
+                constants.CACHE_DIR / "completions",
+                app_data.store if shared else None
+            )
+        app_data.hasher = PasswordHasher(
+            rounds=config.security.bcrypt_rounds,
+            workers=config.security.hash_workers,
+            max_pending=config.security.hash_queue_size
         )
-        config = app_data.config = Config(**toml.load(constants.CONFIG_FILE))
+
+        image = config.image
+        app_data.image = ImageProcessor(image.workers, ImageCache(
+            constants.CACHE_DIR / "images",
+            memory_bytes=image.cache_memory_mb * 1024 * 1024,
+            disk_bytes=image.cache_disk_mb * 1024 * 1024
+        ) if image.cache else None)
 
         database = app_data.config.database
 
         if database.type not in constants.DB_PATH:
             raise UnsupportedDatabaseError(database.type)
 
-        db = app_data.db = DatabaseManager(constants.DB_PATH[database.type])
+        db = app_data.db = DatabaseManager(database.url or constants.DB_PATH[database.type], database)
+
+        if os.environ.get(constants.SCHEMA_READY_ENV):
+            async with db.engine.connect() as conn:
+                await conn.run_sync(load_search_index)
+        else:
+            await create_schema(db)
+
+        history = config.history
+        app_data.writer = BatchWriter(
+            db.async_session,
+            flush_interval=history.flush_interval_ms / 1000,
+            batch_size=history.batch_size,
+            max_queue=history.max_queue,
+            on_flush=touch_sessions
+        )
+        app_data.writer.start()
 
-        async with db.engine.begin() as conn:
-            await conn.run_sync(metadata.create_all)
+        if config.reload.enabled:
+            app_data.watcher = ConfigWatcher(constants.CONFIG_FILE, config.reload.interval, reload_config)
+            app_data.watcher.start()
 
         yield
     except FileNotFoundError:
@@ -41,13 +137,29 @@ async def lifespan(_: FastAPI):
     except Exception as e:
         logger.error(f"Failed to initialize essential resources: {str(e)}")
     finally:
-        await app_data.client.close()
+        if app_data.watcher:
+            await app_data.watcher.close()
+        if app_data.writer:
+            await app_data.writer.close()
+        if app_data.pool:
+            await app_data.pool.close()
+        if app_data.wolfram:
+            await app_data.wolfram.close()
+        if app_data.hasher:
+            app_data.hasher.shutdown()
+        if app_data.image:
+            app_data.image.shutdown()
+        if app_data.limiter:
+            await app_data.limiter.store.close()
+        if app_data.store:
+            await app_data.store.close()
 
 
 app = FastAPI(
     title="raven-client",
     description="LLM Client",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 route.register(app)
 
@@ -56,6 +168,7 @@ app.add_middleware(
     exclude_paths=[
         "/auth/login",
         "/auth/register",
+        "/metrics",
         "/docs",
         "/openapi.json",
     ],
@@ -1,7 +1,7 @@
-from typing import Generic, Optional, TypeVar
+from typing import Generic, List, Optional, TypeVar, Union
 
 from pydantic import BaseModel
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, inspect, text
 from sqlalchemy.orm import declarative_base
 
 T = TypeVar("T")
@@ -14,6 +14,34 @@ from .session import Session, ChatHistory
 MODELS = [User, Session, ChatHistory]
 
 
+def add_missing_columns(connection):
+    """ create_all 不会为已存在的表添加新列，这里用 ALTER TABLE 补齐（新列必须可为空） """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                connection.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(connection.dialect)}"
+                ))
+
+
+def create_indexes(connection):
+    """ create_all 不会为已存在的表补建索引，这里逐个补齐 """
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[Union[str, int]] = None
+
+
 class Response(BaseModel, Generic[T]):
     message: str
     data: Optional[T] = None
@@ -14,29 +14,18 @@ SAVE_DATA_DIR = USER_CONFIG / 'raven-client'
 """ Raven Client 的数据文件夹 """
 CONFIG_FILE = SAVE_DATA_DIR / 'config.toml'
 """ Raven Client 的配置目录 """
+CACHE_DIR = SAVE_DATA_DIR / 'cache'
+""" Raven Client 的磁盘缓存目录 """
+BATCH_DIR = SAVE_DATA_DIR / 'batch'
+""" 批量请求结果目录，用于断点续跑 """
 
-DB_PATH = {
-    "sqlite": f"sqlite+aiosqlite:///{SAVE_DATA_DIR}/raven.db"
-}
-""" Raven Client SQLite 数据库路径 """
+CONFIG_SNAPSHOT_ENV = "RAVEN_CONFIG_SNAPSHOT"
+""" 启动器写出的配置快照（JSON，权限 0600）的路径，所有工作进程使用同一份配置启动；配置中含有密钥，不直接放入环境变量 """
+SCHEMA_READY_ENV = "RAVEN_SCHEMA_READY"
+""" 启动器已创建数据库表结构时设置，工作进程跳过建表 """
 
-
-REQUEST_HEADERS = {
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-    "Accept-Encoding": "gzip, deflate, br, zstd",
-    "Accept-Language": "en-US,en;q=0.9",
-    "Host": "httpbin.org",
-    "Priority": "u=0, i",
-    "Sec-Ch-Ua": "\"Not.A/Brand\";v=\"99\", \"Chromium\";v=\"136\"",
-    "Sec-Ch-Ua-Mobile": "?0",
-    "Sec-Ch-Ua-Platform": "\"Linux\"",
-    "Sec-Fetch-Dest": "document",
-    "Sec-Fetch-Mode": "navigate",
-    "Sec-Fetch-Site": "none",
-    "Sec-Fetch-User": "?1",
-    "Sec-Gpc": "1",
-    "Upgrade-Insecure-Requests": "1",
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-    "X-Amzn-Trace-Id": "Root=1-68219cae-0a53211530686acc2c8c1646"
+DB_PATH = {
+    "sqlite": f"sqlite+aiosqlite:///{SAVE_DATA_DIR}/raven.db",
+    "postgresql": "postgresql+asyncpg://raven@localhost:5432/raven",
 }
-""" 请求头 """
+""" Raven Client 各类型数据库的默认地址，可通过 database.url 覆盖 """
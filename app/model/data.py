@@ -1,10 +1,23 @@
 import secrets
 from dataclasses import dataclass
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, TYPE_CHECKING
 
-from aiohttp import ClientSession
 from pydantic import BaseModel
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import URL, event, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+
+if TYPE_CHECKING:
+    from app.api.wolfram import WolframClient
+    from app.llm.batch import BatchRunner
+    from app.llm.cache import CompletionCache
+    from app.llm.pool import ClientPool
+    from app.llm.router import ProviderRouter
+    from app.model.writer import BatchWriter
+    from app.util.auth import PasswordHasher
+    from app.util.image import ImageProcessor
+    from app.util.ratelimit import RateLimiter
+    from app.util.store import SharedStore
+    from app.util.watcher import ConfigWatcher
 
 
 class ApiKey(BaseModel):
@@ -12,9 +25,57 @@ class ApiKey(BaseModel):
     openai: str = ""
 
 
+class SQLite(BaseModel):
+    """ SQLite 调优参数 """
+    journal_mode: str = "WAL"
+    """ 日志模式，WAL 允许读写并发 """
+    synchronous: str = "NORMAL"
+    """ WAL 模式下 NORMAL 只在检查点时 fsync """
+    mmap_size: int = 256 * 1024 * 1024
+    """ 内存映射读取的大小（字节） """
+    cache_size: int = -64000
+    """ 页缓存大小，负数表示 KiB """
+    busy_timeout: int = 5000
+    """ 数据库被锁定时的等待时间（毫秒） """
+    statement_cache_size: int = 256
+    """ 每个连接缓存的预编译语句数量 """
+
+
+class PostgreSQL(BaseModel):
+    """ PostgreSQL (asyncpg) 连接池参数 """
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    statement_cache_size: int = 500
+    """ 每个连接缓存的预编译语句数量 """
+
+
 class DataBase(BaseModel):
     """ 数据库设置 """
     type: str = "sqlite"
+    url: Optional[str] = None
+    """ 连接地址，默认使用 constants.DB_PATH 中对应类型的地址 """
+    echo: bool = False
+    """ 是否打印所有 SQL 语句 """
+    sqlite: SQLite = SQLite()
+    postgresql: PostgreSQL = PostgreSQL()
+
+
+class HttpClient(BaseModel):
+    """ 上游 HTTP 连接池设置 """
+    limit: int = 100
+    """ 连接池总连接数上限 """
+    limit_per_host: int = 20
+    """ 单个主机的连接数上限 """
+    keepalive_timeout: float = 30
+    """ 空闲连接保活时间（秒） """
+    dns_cache_ttl: int = 300
+    """ DNS 缓存时间（秒） """
+    connect_timeout: float = 10
+    """ 建立连接超时（秒） """
+    read_timeout: float = 300
+    """ 两次读取之间的超时（秒），流式响应不设总超时 """
 
 
 class Provider(BaseModel):
@@ -24,6 +85,154 @@ class Provider(BaseModel):
     base_url: str = ""
     default_model: str = ""
     organization_id: Optional[str] = None
+    models: List[str] = []
+    """ 除 default_model 外支持的模型，用于在多个提供商之间路由 """
+    context_window: int = 65536
+    """ 模型的上下文长度（token），拼接历史记录时按此裁剪 """
+    http: Optional[HttpClient] = None
+
+
+class Router(BaseModel):
+    """ 多提供商路由与熔断设置 """
+    window_size: int = 200
+    """ 统计延迟与错误率的滑动窗口大小 """
+    max_attempts: int = 2
+    """ 单个请求最多尝试的提供商数量 """
+    default_latency: float = 1.0
+    """ 尚无统计数据时假定的延迟（秒） """
+    failure_threshold: int = 5
+    """ 连续失败次数达到该值时熔断 """
+    error_rate_threshold: float = 0.5
+    """ 窗口内错误率达到该值时熔断 """
+    slow_threshold: float = 0
+    """ 窗口内 p95 延迟（秒）超过该值时熔断，0 表示不限制 """
+    min_samples: int = 20
+    """ 按错误率和延迟熔断前所需的最少样本数 """
+    open_seconds: float = 30
+    """ 熔断后经过多久进入半开状态（秒） """
+
+
+class Security(BaseModel):
+    """ 密码哈希设置 """
+    bcrypt_rounds: int = 12
+    """ bcrypt 计算成本 """
+    hash_workers: int = 2
+    """ 执行 bcrypt 的线程数 """
+    hash_queue_size: int = 32
+    """ 等待中的哈希任务上限，超出后直接拒绝 """
+
+
+class History(BaseModel):
+    """ 对话记录写入与历史拼接设置 """
+    flush_interval_ms: int = 200
+    """ 批量写入的最长等待时间（毫秒） """
+    batch_size: int = 100
+    """ 攒够该行数时立即写入 """
+    max_queue: int = 10000
+    """ 写入队列长度上限 """
+    output_reserve: int = 4096
+    """ 请求未指定 max_tokens 时，拼接历史记录为回复预留的 token 数 """
+    context_margin: float = 0.1
+    """ 拼接历史记录时额外预留的上下文比例，抵消 token 计数的误差（没有 tiktoken 时为估算） """
+
+
+class Cache(BaseModel):
+    """ 确定性请求的结果缓存设置 """
+    enabled: bool = True
+    max_entries: int = 1024
+    """ 内存中缓存的条目数上限 """
+    ttl: float = 86400
+    """ 缓存有效期（秒） """
+    disk: bool = False
+    """ 是否同时持久化到数据文件夹 """
+    disk_max_mb: int = 256
+    """ 磁盘缓存大小上限（MB） """
+    coalesce: bool = False
+    """ 相同的确定性请求同时进行时只向上游发送一次，不受 enabled 影响 """
+
+
+class ImageSettings(BaseModel):
+    """ 图片预处理设置 """
+    workers: int = 2
+    """ 处理图片的进程数 """
+    cache: bool = True
+    """ 是否缓存处理结果 """
+    cache_memory_mb: int = 64
+    """ 内存缓存大小上限（MB） """
+    cache_disk_mb: int = 512
+    """ 磁盘缓存大小上限（MB），0 表示只使用内存缓存 """
+
+
+class Batch(BaseModel):
+    """ 批量请求设置 """
+    max_concurrency: int = 32
+    """ 单个批次同时进行的请求数 """
+    provider_concurrency: int = 8
+    """ 所有批次对单个提供商同时进行的请求数 """
+    requests_per_minute: float = 600
+    """ 所有批次对单个提供商每分钟的请求数 """
+    burst: int = 10
+    """ 允许的瞬时突发请求数 """
+
+
+class RateLimit(BaseModel):
+    """ 请求限流设置，每分钟的上限为 0 表示不限制 """
+    enabled: bool = True
+    user_requests_per_minute: float = 60
+    user_tokens_per_minute: float = 200000
+    provider_requests_per_minute: float = 0
+    provider_tokens_per_minute: float = 0
+    store: str = "memory"
+    """ 限流状态存储：memory（进程内）或 redis（多进程共享） """
+    redis_url: str = "redis://localhost:6379/0"
+
+
+class Stream(BaseModel):
+    """ 流式转发设置 """
+    buffer_chunks: int = 64
+    """ 每个流在上游与客户端之间最多缓冲的 chunk 数，客户端读取较慢时暂停读取上游 """
+
+
+class Metrics(BaseModel):
+    """ 指标与链路追踪设置 """
+    enabled: bool = False
+    """ 是否开放 /metrics 接口，该接口不经过用户登录校验 """
+    token: str = ""
+    """ 访问 /metrics 时需要携带的 Bearer token，为空时不校验 """
+    tracing: bool = False
+    """ 是否输出 OpenTelemetry 链路追踪，需要安装 opentelemetry-api """
+
+
+class Wolfram(BaseModel):
+    """ Wolfram|Alpha 工具调用设置，密钥见 apikey.wolfram """
+    timeout: float = 10
+    """ 单次查询的默认超时（秒） """
+    cache_ttl: float = 3600
+    """ 查询结果缓存时间（秒） """
+    cache_size: int = 1024
+    """ 缓存的查询数上限 """
+    max_concurrency: int = 8
+    """ 同时进行的查询数上限 """
+
+
+class Reload(BaseModel):
+    """ 配置热加载设置，providers、http、router、secret、metrics、stream 修改后无需重启 """
+    enabled: bool = True
+    interval: float = 2
+    """ 检查配置文件修改的间隔（秒） """
+    grace_seconds: float = 600
+    """ 被替换的连接池延迟关闭的时间（秒），留给进行中的流式请求完成 """
+
+
+class Server(BaseModel):
+    """ 多进程部署设置，由 python -m app 启动器使用 """
+    host: str = "127.0.0.1"
+    port: int = 8000
+    workers: int = 1
+    """ 工作进程数，0 表示与 CPU 核数相同 """
+    store: str = "memory"
+    """ 共享存储（消息顺序号、结果缓存）：memory（进程内）或 redis（多进程共享） """
+    redis_url: str = "redis://localhost:6379/0"
 
 
 class Config(BaseModel):
@@ -32,6 +241,19 @@ class Config(BaseModel):
     database: Optional[DataBase] = DataBase()
     providers: Dict[str, Provider] = {}
     apikey: ApiKey = ApiKey()
+    http: HttpClient = HttpClient()
+    router: Router = Router()
+    security: Security = Security()
+    history: History = History()
+    cache: Cache = Cache()
+    image: ImageSettings = ImageSettings()
+    batch: Batch = Batch()
+    ratelimit: RateLimit = RateLimit()
+    stream: Stream = Stream()
+    metrics: Metrics = Metrics()
+    wolfram: Wolfram = Wolfram()
+    reload: Reload = Reload()
+    server: Server = Server()
 
     def dump(self) -> Dict:
         data = self.model_dump()
@@ -61,16 +283,75 @@ class Config(BaseModel):
         return config
 
 class DatabaseManager:
-    def __init__(self, database_url: str):
-        self.engine = create_async_engine(database_url, echo=True)
+    def __init__(self, database_url: str, options: DataBase = DataBase()):
+        url = make_url(database_url)
+        self.backend = url.get_backend_name()
+
+        if self.backend == "sqlite":
+            self.engine = self._sqlite_engine(url, options)
+        elif self.backend == "postgresql":
+            self.engine = self._postgresql_engine(url, options)
+        else:
+            self.engine = create_async_engine(url, echo=options.echo)
+
         self.async_session = async_sessionmaker(
             self.engine,
             expire_on_commit=False
         )
 
+    @staticmethod
+    def _sqlite_engine(url: URL, options: DataBase) -> AsyncEngine:
+        sqlite = options.sqlite
+        engine = create_async_engine(
+            url,
+            echo=options.echo,
+            connect_args={
+                "timeout": sqlite.busy_timeout / 1000,
+                "cached_statements": sqlite.statement_cache_size,
+            }
+        )
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_pragmas(dbapi_connection, _):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"PRAGMA journal_mode={sqlite.journal_mode}")
+            cursor.execute(f"PRAGMA synchronous={sqlite.synchronous}")
+            cursor.execute(f"PRAGMA mmap_size={int(sqlite.mmap_size)}")
+            cursor.execute(f"PRAGMA cache_size={int(sqlite.cache_size)}")
+            cursor.execute(f"PRAGMA busy_timeout={int(sqlite.busy_timeout)}")
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+        return engine
+
+    @staticmethod
+    def _postgresql_engine(url: URL, options: DataBase) -> AsyncEngine:
+        postgresql = options.postgresql
+        if "prepared_statement_cache_size" not in url.query:
+            url = url.update_query_dict({"prepared_statement_cache_size": str(postgresql.statement_cache_size)})
+        return create_async_engine(
+            url,
+            echo=options.echo,
+            pool_size=postgresql.pool_size,
+            max_overflow=postgresql.max_overflow,
+            pool_timeout=postgresql.pool_timeout,
+            pool_recycle=postgresql.pool_recycle,
+            pool_pre_ping=True,
+        )
+
 
 @dataclass
 class AppData:
     db: Optional[DatabaseManager] = None
-    client: Optional[ClientSession] = None
     config: Optional[Config] = None
+    pool: Optional["ClientPool"] = None
+    router: Optional["ProviderRouter"] = None
+    hasher: Optional["PasswordHasher"] = None
+    writer: Optional["BatchWriter"] = None
+    cache: Optional["CompletionCache"] = None
+    image: Optional["ImageProcessor"] = None
+    batch: Optional["BatchRunner"] = None
+    limiter: Optional["RateLimiter"] = None
+    watcher: Optional["ConfigWatcher"] = None
+    wolfram: Optional["WolframClient"] = None
+    store: Optional["SharedStore"] = None
@@ -0,0 +1,51 @@
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.util.tokens import count_message_tokens
+
+
+class ChatMessage(BaseModel):
+    """ 对话消息 """
+    role: str
+    content: Union[str, List[Dict[str, Any]]]
+
+
+class ChatRequest(BaseModel):
+    """ OpenAI 格式的对话请求，未声明的字段原样转发给提供商 """
+    model_config = ConfigDict(extra="allow")
+
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    messages: List[ChatMessage]
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    stream: bool = True
+    session_id: Optional[str] = None
+    """ 指定后本轮对话会写入该会话的历史记录 """
+    cache: Optional[bool] = None
+    """ 是否使用结果缓存，默认只缓存 temperature 为 0 的请求 """
+    history: bool = False
+    """ 是否由服务端在 messages 前拼接 session_id 对应会话的历史记录（按上下文窗口裁剪） """
+
+    def estimate_tokens(self) -> int:
+        """ 估计本次请求消耗的 token 数（输入 token 数加上输出上限），用于限流预扣 """
+        return sum(count_message_tokens(message.content) for message in self.messages) + (self.max_tokens or 0)
+
+    def payload(self, default_model: str) -> Dict[str, Any]:
+        """ 生成发往提供商的请求体 """
+        data = self.model_dump(exclude={"provider", "session_id", "cache", "history"}, exclude_none=True)
+        data["model"] = self.model or default_model
+        return data
+
+
+class BatchItem(BaseModel):
+    """ 批量请求中的一项，id 用于匹配结果与断点续跑 """
+    id: str
+    request: ChatRequest
+
+
+class BatchRequest(BaseModel):
+    batch_id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    """ 指定已有的批次 ID 时，已成功的项直接返回之前的结果，不会重复请求 """
+    items: List[BatchItem]
@@ -0,0 +1,278 @@
+"""
+对话记录全文检索。
+SQLite 使用 FTS5 外部内容表，由触发器随 chat_history 增量维护；trigram 分词支持中文子串检索，
+不支持时退回 unicode61。PostgreSQL 使用生成列维护的 tsvector 与 GIN 索引。
+多模态消息（chat_history.multimodal，内容为 JSON 数组）不建立索引，避免把图片 base64 写入索引。
+FTS5 索引按 chat_history 的隐式 rowid 关联，而 chat_history 的主键是字符串，VACUUM 可能重新编号 rowid，
+之后需要执行 rebuild_search_index（python -m app --rebuild-search-index）重建索引。
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+FTS_TABLE = "chat_history_fts"
+TRIGRAM = "trigram"
+SNIPPET_CHARS = 80
+""" 摘要的大致长度（字符） """
+
+_fts_tokenizer: Optional[str] = None
+""" 当前 SQLite 全文索引使用的分词器，由 create_search_index 设置 """
+
+_LEGACY_MULTIMODAL = "content LIKE '[{%'"
+""" 添加 multimodal 列之前按内容前缀判断多模态消息，只用于补齐旧数据，与旧索引的范围一致 """
+
+_SQLITE_TRIGGER_NAMES = ["chat_history_fts_ai", "chat_history_fts_ad", "chat_history_fts_bu", "chat_history_fts_au"]
+
+_SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER chat_history_fts_ai AFTER INSERT ON chat_history
+    WHEN NOT coalesce(new.multimodal, 0) BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.rowid, new.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_history_fts_ad AFTER DELETE ON chat_history
+    WHEN NOT coalesce(old.multimodal, 0) BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_history_fts_bu BEFORE UPDATE OF content ON chat_history
+    WHEN NOT coalesce(old.multimodal, 0) BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_history_fts_au AFTER UPDATE OF content ON chat_history
+    WHEN NOT coalesce(new.multimodal, 0) BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.rowid, new.content);
+    END
+    """,
+]
+
+_POSTGRESQL_STATEMENTS = [
+    # 生成列由数据库随写入维护；截断过长的内容，避免超出 tsvector 的大小限制
+    f"""
+    ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS content_tsv tsvector GENERATED ALWAYS AS (
+        to_tsvector('simple', CASE WHEN coalesce(multimodal, false) THEN '' ELSE left(coalesce(content, ''), 100000) END)
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_chat_history_content_tsv ON chat_history USING GIN (content_tsv)",
+]
+
+
+class SearchResult(BaseModel):
+    id: str
+    session_id: str
+    session_title: Optional[str]
+    role: str
+    snippet: str
+    score: float
+    created_at: Optional[datetime]
+
+
+def _sqlite_tokenizer(connection) -> Optional[str]:
+    row = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first()
+    if row is None:
+        return None
+    return TRIGRAM if TRIGRAM in row[0] else "unicode61"
+
+
+_SQLITE_FILL = (
+    f"INSERT INTO {FTS_TABLE}(rowid, content) "
+    f"SELECT rowid, content FROM chat_history WHERE NOT coalesce(multimodal, 0)"
+)
+""" 按当前的 rowid 为全部非多模态消息建立索引 """
+
+
+def _create_sqlite_index(connection) -> str:
+    tokenizer = _sqlite_tokenizer(connection)
+    if tokenizer is not None:
+        return tokenizer
+
+    tokenizer = TRIGRAM
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"content, content='chat_history', content_rowid='rowid', tokenize='{TRIGRAM}')"
+        ))
+    except OperationalError:
+        # SQLite 3.34 之前没有 trigram 分词器
+        tokenizer = "unicode61"
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"content, content='chat_history', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+        ))
+    # 为建立索引之前的历史记录补建索引
+    connection.execute(text(_SQLITE_FILL))
+    return tokenizer
+
+
+def _mark_legacy_multimodal(connection):
+    """ 为添加 multimodal 列之前写入的消息补齐标记 """
+    connection.execute(text(
+        f"UPDATE chat_history SET multimodal = ({_LEGACY_MULTIMODAL}) WHERE multimodal IS NULL"
+    ))
+
+
+def _drop_legacy_tsv(connection):
+    """ 旧版本的生成列按内容前缀排除多模态消息，表达式无法修改，删除后按新表达式重建 """
+    expression = connection.execute(text(
+        "SELECT generation_expression FROM information_schema.columns "
+        "WHERE table_name = 'chat_history' AND column_name = 'content_tsv'"
+    )).scalar()
+    if expression is not None and "multimodal" not in expression:
+        connection.execute(text("ALTER TABLE chat_history DROP COLUMN content_tsv"))
+
+
+def create_search_index(connection):
+    """ 创建全文索引及其维护触发器（已存在时跳过，触发器总是重建），在 create_all 与补齐列之后执行 """
+    global _fts_tokenizer
+    backend = connection.dialect.name
+    _mark_legacy_multimodal(connection)
+    if backend == "sqlite":
+        _fts_tokenizer = _create_sqlite_index(connection)
+        for name in _SQLITE_TRIGGER_NAMES:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        for statement in _SQLITE_TRIGGERS:
+            connection.execute(text(statement))
+    elif backend == "postgresql":
+        _drop_legacy_tsv(connection)
+        for statement in _POSTGRESQL_STATEMENTS:
+            connection.execute(text(statement))
+
+
+def rebuild_search_index(connection):
+    """
+    清空并重建 SQLite 全文索引，VACUUM 重新编号 chat_history 的 rowid 后执行。
+    不使用 FTS5 的 'rebuild'，它会把多模态消息也写入索引；PostgreSQL 的生成列不受影响，无需处理
+    """
+    if connection.dialect.name != "sqlite" or _sqlite_tokenizer(connection) is None:
+        return
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"))
+    connection.execute(text(_SQLITE_FILL))
+
+
+def load_search_index(connection):
+    """ 只读取已有全文索引的分词器，不做修改；用于表结构已由其他进程创建的情况 """
+    global _fts_tokenizer
+    if connection.dialect.name == "sqlite":
+        _fts_tokenizer = _sqlite_tokenizer(connection)
+
+
+def _terms(query: str) -> List[str]:
+    return [term for term in query.split() if term]
+
+
+def _snippet(content: str, terms: List[str]) -> str:
+    """ 截取第一个命中词附近的内容 """
+    content = content or ""
+    lowered = content.lower()
+    position = min((i for i in (lowered.find(term.lower()) for term in terms) if i >= 0), default=0)
+    start = max(0, position - SNIPPET_CHARS // 4)
+    snippet = content[start:start + SNIPPET_CHARS]
+    return ("…" if start > 0 else "") + snippet + ("…" if start + SNIPPET_CHARS < len(content) else "")
+
+
+def _fts_query(terms: List[str]) -> str:
+    # 每个词作为短语加引号，用户输入中的 FTS 语法不会生效
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+
+
+_SQLITE_FTS_QUERY = f"""
+SELECT h.id, h.session_id, s.title, h.message_type, h.create_at,
+       snippet({FTS_TABLE}, 0, '', '', '…', 32) AS snippet, -bm25({FTS_TABLE}) AS score
+FROM {FTS_TABLE}
+JOIN chat_history h ON h.rowid = {FTS_TABLE}.rowid
+JOIN session s ON s.id = h.session_id
+WHERE {FTS_TABLE} MATCH :query AND s.user_id = :user_id
+ORDER BY score DESC
+LIMIT :limit OFFSET :offset
+"""
+
+_POSTGRESQL_QUERY = """
+SELECT h.id, h.session_id, s.title, h.message_type, h.create_at, h.content,
+       ts_rank(h.content_tsv, q) AS score
+FROM chat_history h
+JOIN session s ON s.id = h.session_id
+CROSS JOIN websearch_to_tsquery('simple', :query) AS q
+WHERE s.user_id = :user_id AND h.content_tsv @@ q
+ORDER BY score DESC, h.id
+LIMIT :limit OFFSET :offset
+"""
+
+
+def _like_query(count: int) -> str:
+    conditions = " AND ".join(f"h.content LIKE :term{i} ESCAPE '\\'" for i in range(count))
+    return f"""
+    SELECT h.id, h.session_id, s.title, h.message_type, h.create_at, h.content, 0 AS score
+    FROM chat_history h
+    JOIN session s ON s.id = h.session_id
+    WHERE s.user_id = :user_id AND NOT coalesce(h.multimodal, 0) AND {conditions}
+    ORDER BY h.create_at DESC
+    LIMIT :limit OFFSET :offset
+    """
+
+
+async def search_messages(
+        session: async_sessionmaker,
+        backend: str,
+        user_id: str,
+        query: str,
+        limit: int,
+        offset: int = 0
+) -> Tuple[List[SearchResult], Optional[int]]:
+    """
+    在用户的全部对话记录中检索，按相关度排序
+    参数：
+    :param backend: 数据库类型，决定使用的索引
+    :param offset: 分页游标，即已返回的结果数
+    返回：
+    :return: (结果列表, 下一页游标)
+    """
+    terms = _terms(query)
+    if not terms:
+        return [], None
+
+    params: Dict[str, Any] = {"user_id": user_id, "limit": limit + 1, "offset": offset}
+    raw_content = False
+    if backend == "postgresql":
+        statement = _POSTGRESQL_QUERY
+        params["query"] = query
+        raw_content = True
+    elif backend == "sqlite" and _fts_tokenizer and (_fts_tokenizer != TRIGRAM or min(map(len, terms)) >= 3):
+        statement = _SQLITE_FTS_QUERY
+        params["query"] = _fts_query(terms)
+    else:
+        # trigram 无法匹配少于 3 个字符的词，退回到只扫描该用户消息的 LIKE 查询
+        statement = _like_query(len(terms))
+        params.update({f"term{i}": _like_pattern(term) for i, term in enumerate(terms)})
+        raw_content = True
+
+    async with session() as session:
+        rows = (await session.execute(text(statement), params)).all()
+
+    items = [
+        SearchResult(
+            id=row[0],
+            session_id=row[1],
+            session_title=row[2],
+            role=row[3],
+            created_at=row[4],
+            snippet=_snippet(row[5], terms) if raw_content else row[5],
+            score=row[6] or 0,
+        )
+        for row in rows[:limit]
+    ]
+    return items, offset + limit if len(rows) > limit else None
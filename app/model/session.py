@@ -1,23 +1,36 @@
-from typing import Dict
+import asyncio
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
 
+from pydantic import BaseModel, ConfigDict
 from sqlalchemy import (
-    Column, Integer, String, Text, DateTime, JSON
+    Boolean, Column, Integer, String, Text, DateTime, JSON, Index, func, select, tuple_, update
 )
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
 from app.model import Base
 from app.util import time
+from app.util.cache import TTLCache
+from app.util.store import LocalSharedStore, SharedStore
+from app.util.tokens import count_message_tokens
 
 
 class Session(Base):
     __tablename__ = "session"
 
     id = Column('id', String(36), primary_key=True, default=lambda: str(uuid4()), comment="会话ID")
-    user_id = Column('user_id', Integer, comment="用户ID")
+    user_id = Column('user_id', String(36), comment="用户ID")
     title = Column('title', String(255), default="新对话", comment="会话标题")
     created_at = Column('created_at', DateTime, default=time.utcnow, comment="创建时间")
     updated_at = Column('updated_at', DateTime, default=time.utcnow, onupdate=time.utcnow, comment="更新时间")
 
+    __table_args__ = (
+        Index("ix_session_user_updated", "user_id", "updated_at"),
+    )
+
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
@@ -26,9 +39,231 @@ class ChatHistory(Base):
     session_id = Column('session_id', String(36), comment="会话ID")
     message_type = Column('message_type', String(10), comment="消息类型")
     content = Column('content', Text, comment="消息内容")
+    multimodal = Column('multimodal', Boolean, default=False, comment="是否为多模态消息，内容为 JSON 数组")
     model_used = Column('model_used', String(50), comment="模型")
     order = Column('order', Integer, comment="消息顺序")
     prompt_tokens = Column('prompt_tokens', Integer, default=0, comment="prompt tokens")
     completion_tokens = Column('completion_tokens', Integer, default=0, comment="completion tokens")
+    token_count = Column('token_count', Integer, nullable=True, comment="消息本身的 token 数")
     request_params = Column('request_params', JSON, comment="请求参数")
-    create_at = Column('create_at', DateTime, default=time.utcnow, comment="创建时间")
\ No newline at end of file
+    create_at = Column('create_at', DateTime, default=time.utcnow, comment="创建时间")
+
+    __table_args__ = (
+        Index("ix_chat_history_session_order", "session_id", "order"),
+    )
+
+
+class SessionCreateRequest(BaseModel):
+    title: Optional[str] = None
+
+
+class SessionInfo(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    title: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+
+class MessageInfo(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    message_type: Optional[str]
+    content: Optional[str]
+    model_used: Optional[str]
+    order: int
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    create_at: datetime
+
+
+class MessageOrder:
+    """
+    分配会话内的消息顺序号。
+    计数保存在共享存储中，多个工作进程使用同一个共享存储时序号不会重复。
+    计数不存在时按数据库中的最大顺序号初始化，同一会话的初始化在进程内加锁进行；
+    本进程已分配、可能仍在写后队列中未落库的顺序号也计算在内，计数过期或被淘汰后不会重复分配。
+    """
+
+    def __init__(self, store: Optional[SharedStore] = None, maxsize: int = 10000, ttl: float = 3600, stripes: int = 64):
+        self.store: SharedStore = store or LocalSharedStore(maxsize)
+        self.ttl = ttl
+        self.owners: TTLCache[str] = TTLCache(maxsize, ttl)
+        """ 会话所属用户，创建后不会改变，各进程分别缓存 """
+        self.issued: TTLCache[int] = TTLCache(maxsize, ttl)
+        """ 本进程为每个会话分配过的下一个顺序号 """
+        self.locks = [asyncio.Lock() for _ in range(stripes)]
+        """ 按会话分段的初始化锁 """
+
+    async def _seed(self, session: async_sessionmaker, session_id: str, key: str) -> Optional[str]:
+        """ 读取会话所属用户并在计数不存在时初始化，会话不存在时返回 None """
+        async with self.locks[hash(session_id) % len(self.locks)]:
+            owner = self.owners.get(session_id)
+            if owner is not None and await self.store.get(key) is not None:
+                return owner
+            async with session() as session:
+                owner = await session.scalar(
+                    select(Session.user_id).where(Session.id == session_id)  # type: ignore
+                )
+                if owner is None:
+                    return None
+                last = await session.scalar(
+                    select(func.max(ChatHistory.order)).where(ChatHistory.session_id == session_id)  # type: ignore
+                )
+            owner = str(owner)
+            self.owners.set(session_id, owner)
+            start = max(0 if last is None else last + 1, self.issued.get(session_id, 0, count=False))
+            # 其他进程已经初始化时不覆盖
+            await self.store.add(key, start, self.ttl)
+            return owner
+
+    async def reserve(
+            self,
+            session: async_sessionmaker,
+            session_id: str,
+            user_id: str,
+            count: int = 2
+    ) -> Optional[int]:
+        """ 预留 count 个连续的顺序号并返回第一个，会话不存在或不属于该用户时返回 None """
+        key = f"order:{session_id}"
+        owner = self.owners.get(session_id)
+        if owner is None or await self.store.get(key) is None:
+            owner = await self._seed(session, session_id, key)
+            if owner is None:
+                return None
+
+        if owner != user_id:
+            return None
+        end = await self.store.incr(key, count, self.ttl)
+        self.issued.set(session_id, max(end, self.issued.get(session_id, 0, count=False)))
+        return end - count
+
+
+message_order = MessageOrder()
+
+
+def new_chat_histories(
+        session_id: str,
+        order: int,
+        prompt: Dict[str, Any],
+        reply: str,
+        model: str,
+        usage: Dict[str, int],
+        request_params: Dict[str, Any]
+) -> List[ChatHistory]:
+    """ 生成一轮对话（用户消息与模型回复）的记录 """
+    return [
+        ChatHistory(
+            session_id=session_id,
+            message_type=prompt["role"],
+            content=prompt["content"] if isinstance(prompt["content"], str) else json.dumps(prompt["content"], ensure_ascii=False),
+            multimodal=not isinstance(prompt["content"], str),
+            model_used=model,
+            order=order,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            token_count=count_message_tokens(prompt["content"]),
+            request_params=request_params,
+        ),
+        ChatHistory(
+            session_id=session_id,
+            message_type="assistant",
+            content=reply,
+            model_used=model,
+            order=order + 1,
+            completion_tokens=usage.get("completion_tokens", 0),
+            token_count=count_message_tokens(reply),
+            request_params=request_params,
+        ),
+    ]
+
+
+def decode_content(row: ChatHistory) -> Union[str, List[Dict[str, Any]]]:
+    """ 还原消息内容，多模态消息以 JSON 数组保存，解码为原来的结构化内容 """
+    content = row.content or ""
+    if row.multimodal:
+        try:
+            parts = json.loads(content)
+        except ValueError:
+            return content
+        if isinstance(parts, list):
+            return parts
+    return content
+
+
+async def touch_sessions(session: AsyncSession, rows: List[Any]):
+    """ 写入对话记录时更新所属会话的 updated_at，使会话列表按最近活跃排序 """
+    session_ids = {row.session_id for row in rows if isinstance(row, ChatHistory)}
+    if session_ids:
+        await session.execute(
+            update(Session).where(Session.id.in_(session_ids)).values(updated_at=time.utcnow())
+        )
+
+
+def encode_session_cursor(item: Session) -> str:
+    return base64.urlsafe_b64encode(f"{item.updated_at.isoformat()}|{item.id}".encode()).decode()
+
+
+def decode_session_cursor(cursor: str) -> Tuple[datetime, str]:
+    updated_at, _, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+    return datetime.fromisoformat(updated_at), session_id
+
+
+async def list_sessions(
+        session: async_sessionmaker,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+) -> Tuple[List[Session], Optional[str]]:
+    """
+    按最近更新时间倒序分页获取用户的会话（键集分页，使用 (user_id, updated_at) 索引）
+    返回：
+    :return: (会话列表, 下一页游标)
+    """
+    query = select(Session).where(Session.user_id == user_id)  # type: ignore
+    if cursor:
+        query = query.where(tuple_(Session.updated_at, Session.id) < decode_session_cursor(cursor))
+    query = query.order_by(Session.updated_at.desc(), Session.id.desc()).limit(limit + 1)
+
+    async with session() as session:
+        items = list((await session.execute(query)).scalars())
+
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_session_cursor(items[-1])
+
+
+async def list_messages(
+        session: async_sessionmaker,
+        session_id: str,
+        limit: int,
+        before: Optional[int] = None
+) -> Tuple[List[ChatHistory], Optional[int]]:
+    """
+    从最新的消息开始向前分页（键集分页，使用 (session_id, order) 索引），每页内按顺序升序返回
+    返回：
+    :return: (消息列表, 下一页游标，即本页最小的顺序号)
+    """
+    query = select(ChatHistory).where(ChatHistory.session_id == session_id)  # type: ignore
+    if before is not None:
+        query = query.where(ChatHistory.order < before)
+    query = query.order_by(ChatHistory.order.desc()).limit(limit + 1)
+
+    async with session() as session:
+        items = list((await session.execute(query)).scalars())
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1].order
+    items.reverse()
+    return items, next_cursor
+
+
+async def get_user_session(session: async_sessionmaker, session_id: str, user_id: str) -> Optional[Session]:
+    async with session() as session:
+        query = select(Session).where(Session.id == session_id, Session.user_id == user_id)  # type: ignore
+        result = await session.execute(query)
+        return result.scalar_one_or_none()
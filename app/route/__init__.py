@@ -2,10 +2,14 @@ from fastapi import FastAPI
 
 from .auth import router as auth
 from .llm import router as llm
+from .metrics import router as metrics
+from .session import router as session
 
-__all__ = ["auth", "llm"]
+__all__ = ["auth", "llm", "metrics", "session"]
 
 
 def register(app: FastAPI):
     app.include_router(auth, prefix="/auth")
-    app.include_router(llm, prefix="/llm")
\ No newline at end of file
+    app.include_router(llm, prefix="/llm")
+    app.include_router(session, prefix="/sessions")
+    app.include_router(metrics, prefix="/metrics")
\ No newline at end of file
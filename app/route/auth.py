@@ -7,11 +7,12 @@ from sqlalchemy import or_
 from sqlalchemy import select
 
 from app.data import app_data
+from app.error.auth import HasherBusyError
 from app.logger import logger
 from app.model import Response, User
 from app.model.user import insert_users, UserLoginRequest, LoginResponseData, UserRegisterRequest
 from app.util import time
-from app.util.auth import generate_password_hash, verify_password, generate_access_token
+from app.util.auth import generate_access_token
 
 router = APIRouter()
 
@@ -36,7 +37,7 @@ async def login(login_data: UserLoginRequest) -> Response[Optional[LoginResponse
                     data=None
                 )
 
-            if not verify_password(login_data.password, user.password_hash):
+            if not await app_data.hasher.verify(login_data.password, user.password_hash):
                 return Response(
                     success=False,
                     message="错误的密码",
@@ -58,6 +59,13 @@ async def login(login_data: UserLoginRequest) -> Response[Optional[LoginResponse
                     token=access_token,
                 )
             )
+    except HasherBusyError as e:
+        logger.warning(f"登录繁忙: {e.message}")
+        return Response(
+            success=False,
+            message="服务繁忙，请稍后再试",
+            data=None
+        )
     except Exception as e:
         logger.error(f"登录失败: {str(e)}")
         return Response(
@@ -90,12 +98,19 @@ async def register(user_data: UserRegisterRequest) -> Response[None]:
             new_user = User(
                 username=user_data.username,
                 email=str(user_data.email),
-                password_hash=generate_password_hash(user_data.password),
+                password_hash=await app_data.hasher.hash(user_data.password),
                 api_key=str(uuid4())
             )
 
             await insert_users(app_data.db.async_session, [new_user])
 
+    except HasherBusyError as e:
+        logger.warning(f"注册繁忙: {e.message}")
+        return Response(
+            message="服务繁忙，请稍后再试",
+            data=None,
+            success=False
+        )
     except Exception as e:
         logger.error("注册用户发生异常：", str(e))
     return Response(
@@ -1,13 +1,355 @@
 import asyncio
+import math
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+from uuid import uuid4
 
-from fastapi import APIRouter
+from aiohttp import ClientError
+from fastapi import APIRouter, Request
+from starlette import status
 from starlette.responses import StreamingResponse
 
+from app.data import app_data
+from app.error.llm import UpstreamError, ProviderNotFoundError, RateLimitExceededError, RequestTooLargeError
+from app.llm import OneApi, StreamAccumulator
+from app.llm.batch import ProviderLimits
+from app.llm.cache import cache_key, is_cacheable
+from app.llm.coalesce import StreamResult, completions, streams
+from app.llm.context import ContextWindow
+from app.llm.openai import validate_response
+from app.llm.relay import Relay, RelayResponse
 from app.model import Response
+from app.model.data import Provider
+from app.model.llm import BatchRequest, ChatMessage, ChatRequest
+from app.model.session import message_order, new_chat_histories
+from app.util.auth import get_token_payload
+from app.util.metrics import REQUEST_DURATION, TIME_TO_FIRST_TOKEN, TOKENS_PER_SECOND, span
+from app.util.serializer import FastJSONResponse, dumps
+from app.util.tokens import count_message_tokens, count_tokens
 
 router = APIRouter()
 
 
+def candidate_providers(name: str = None) -> Dict[str, Provider]:
+    """ 指定了提供商时只使用该提供商，否则在所有提供商之间路由 """
+    providers = app_data.config.providers
+    if name is None:
+        return providers
+
+    provider = providers.get(name)
+    if provider is None or not provider.enabled:
+        raise ProviderNotFoundError(name)
+    return {name: provider}
+
+
+async def _record(
+        request: ChatRequest,
+        order: int,
+        provider: str,
+        model: str,
+        reply: str,
+        usage: Dict[str, int],
+        interrupted: bool = False
+):
+    """ 将本轮对话交给写后队列持久化，interrupted 表示客户端中途断开、reply 只是已生成的部分 """
+    request_params = {
+        "provider": provider,
+        "temperature": request.temperature,
+        "max_tokens": request.max_tokens,
+    }
+    if interrupted:
+        request_params["interrupted"] = True
+    await app_data.writer.put(*new_chat_histories(
+        session_id=request.session_id,
+        order=order,
+        prompt=request.messages[-1].model_dump(),
+        reply=reply,
+        model=model,
+        usage=usage,
+        request_params=request_params
+    ))
+
+
+def _model(request: ChatRequest, provider: Provider) -> str:
+    return request.model or provider.default_model
+
+
+def _model_label(request: ChatRequest, provider: Provider) -> str:
+    """ 指标的 model 标签，只使用配置中的模型，其它任意模型名归为 other，避免客户端制造无限多的时间序列 """
+    model = _model(request, provider)
+    return model if model == provider.default_model or model in provider.models else "other"
+
+
+def _api(name: str, provider: Provider) -> OneApi:
+    """ 使用选择候选提供商时的配置，热加载期间提供商被移除时由连接池抛出 ProviderNotFoundError """
+    return OneApi(provider, app_data.pool.get(name))
+
+
+async def _acquire_provider(name: str, tokens: int, charged: Optional[Set[str]] = None):
+    """ 扣减提供商额度，并把提供商记入 charged，结算时只调整实际预扣过的提供商 """
+    if app_data.limiter:
+        await app_data.limiter.acquire_provider(name, tokens)
+        if charged is not None:
+            charged.add(name)
+
+
+def _usage_tokens(usage: Dict[str, int]) -> int:
+    return usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+
+def _estimate_usage(request: ChatRequest, reply: str) -> Dict[str, int]:
+    """ 上游没有返回用量时（客户端中途断开或提供商不返回 usage）按已生成的内容估算 """
+    return {
+        "prompt_tokens": sum(count_message_tokens(message.content) for message in request.messages),
+        "completion_tokens": count_tokens(reply),
+    }
+
+
+def _request_key(request: ChatRequest, providers: Dict[str, Provider]) -> Optional[str]:
+    """
+    确定性请求的规范化哈希，用于结果缓存与合并相同的进行中请求；非确定性请求返回 None。
+    未指定提供商时结果取决于路由，按全部候选提供商及各自解析出的模型计算
+    """
+    if not is_cacheable(request.temperature, request.cache):
+        return None
+    targets = sorted(
+        [name, request.model or provider.default_model]
+        for name, provider in providers.items() if provider.enabled
+    )
+    payload = request.payload("")
+    del payload["model"]
+    return cache_key(targets, payload)
+
+
+async def _chat(
+        request: ChatRequest,
+        providers: Dict[str, Provider],
+        limits: Optional[ProviderLimits] = None,
+        tokens: int = 0,
+        charged: Optional[Set[str]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    非流式请求，确定性请求优先读取结果缓存，相同的进行中请求只向上游发送一次；
+    指定 limits 时按提供商限制并发与速率；本请求预扣过额度的提供商记入 charged，命中缓存或合并到其他请求时为空
+    """
+    key = _request_key(request, providers)
+    if key and app_data.cache:
+        cached = await app_data.cache.get(key)
+        if cached is not None:
+            return cached["provider"], cached["result"]
+
+    async def call(name: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with span("llm.chat", provider=name, model=request.model):
+            result = await _api(name, providers[name]).chat(request)
+        REQUEST_DURATION.observe(
+            time.perf_counter() - started,
+            provider=name,
+            model=_model_label(request, providers[name]),
+            stream="false"
+        )
+        return result
+
+    async def attempt(name: str) -> Dict[str, Any]:
+        await _acquire_provider(name, tokens, charged)
+        if limits is None:
+            return await call(name)
+        async with limits.slot(name):
+            return await call(name)
+
+    async def route() -> Tuple[str, Dict[str, Any]]:
+        name, result = await app_data.router.call(providers, attempt, request.model)
+        if key and app_data.cache:
+            await app_data.cache.set(key, {"provider": name, "result": result})
+        return name, result
+
+    if key and app_data.config.cache.coalesce:
+        return await completions.do(key, route)
+    return await route()
+
+
+async def _open_stream(
+        name: str,
+        provider: Provider,
+        request: ChatRequest,
+        tokens: int,
+        charged: Optional[Set[str]] = None
+) -> Tuple[bytes, AsyncIterator[bytes]]:
+    # 先取到首个 chunk 再返回响应头，上游错误仍能以正确的状态码返回，也能切换到备用提供商
+    await _acquire_provider(name, tokens, charged)
+    stream = _api(name, provider).forward(request)
+    started = time.perf_counter()
+    try:
+        with span("llm.first_token", provider=name, model=request.model):
+            first = await anext(stream)
+    except StopAsyncIteration:
+        first = b""
+    TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, provider=name, model=_model_label(request, provider))
+    return first, stream
+
+
+async def _with_history(request: ChatRequest, providers: Dict[str, Provider]) -> ChatRequest:
+    """
+    在请求前拼接会话历史，按候选提供商中最小的上下文长度裁剪；
+    为回复预留 max_tokens（未指定时为 history.output_reserve），并按 history.context_margin 留出余量
+    """
+    settings = app_data.config.history
+    context_window = min(
+        (provider.context_window for provider in providers.values() if provider.enabled),
+        default=0
+    )
+    reserve = request.max_tokens or settings.output_reserve
+    window = ContextWindow(max(0, int(context_window * (1 - settings.context_margin)) - reserve))
+    messages = await window.build(
+        app_data.db.async_session,
+        request.session_id,
+        [message.model_dump() for message in request.messages]
+    )
+    return request.model_copy(update={"messages": [ChatMessage(**message) for message in messages]})
+
+
+@router.post("/chat/completions")
+async def chat_completions(request: ChatRequest, http_request: Request):
+    user_id = get_token_payload(http_request)["sub"]
+
+    order: Optional[int] = None
+    if request.session_id:
+        order = await message_order.reserve(app_data.db.async_session, request.session_id, user_id)
+        if order is None:
+            return FastJSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content=Response(message="会话不存在", success=False)
+            )
+
+    try:
+        providers = candidate_providers(request.provider)
+        if request.history and order is not None:
+            request = await _with_history(request, providers)
+
+        tokens = request.estimate_tokens()
+        if app_data.limiter:
+            await app_data.limiter.acquire_user(user_id, tokens)
+
+        # 合并到其他请求或命中缓存时没有预扣提供商额度，只结算用户额度
+        charged: Set[str] = set()
+        if not request.stream:
+            name, result = await _chat(request, providers, tokens=tokens, charged=charged)
+            reply = await validate_response(result) or ""
+            # 提供商没有返回用量时按回复估算，避免预扣的额度被全部退还
+            usage = result.get("usage") or _estimate_usage(request, reply)
+            if app_data.limiter:
+                await app_data.limiter.settle(
+                    user_id, name if name in charged else None, tokens, _usage_tokens(usage)
+                )
+            if order is not None:
+                await _record(request, order, name, _model(request, providers[name]), reply, usage)
+            return Response(message="请求成功", data=result)
+
+        async def open_stream() -> StreamResult:
+            return await app_data.router.call(
+                providers, lambda name: _open_stream(name, providers[name], request, tokens, charged), request.model
+            )
+
+        started = time.perf_counter()
+        key = _request_key(request, providers)
+        if key and app_data.config.cache.coalesce:
+            name, (first, stream) = await streams.open(key, open_stream, app_data.config.stream.buffer_chunks)
+        else:
+            name, (first, stream) = await open_stream()
+        first_token_at = time.perf_counter()
+    except RateLimitExceededError as e:
+        return FastJSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content=Response(message=e.message, success=False),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except RequestTooLargeError as e:
+        return FastJSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            content=Response(message=e.message, success=False)
+        )
+    except ProviderNotFoundError as e:
+        return FastJSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content=Response(message=e.message, success=False)
+        )
+    except UpstreamError as e:
+        return FastJSONResponse(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            content=Response(message=e.message, data=e.body, success=False)
+        )
+    except (ClientError, asyncio.TimeoutError) as e:
+        return FastJSONResponse(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            content=Response(message=f"网络请求异常：{str(e)}", success=False)
+        )
+
+    model = _model(request, providers[name])
+    label = _model_label(request, providers[name])
+    accumulator: Optional[StreamAccumulator] = None
+    if order is not None or app_data.limiter:
+        accumulator = StreamAccumulator()
+    elif app_data.config.metrics.enabled:
+        # 只有指标需要用量，不累计内容
+        accumulator = StreamAccumulator(content=False)
+
+    async def on_finish(completed: bool):
+        finished = time.perf_counter()
+        REQUEST_DURATION.observe(finished - started, provider=name, model=label, stream="true")
+        if accumulator is None:
+            return
+        completion = accumulator.usage.get("completion_tokens")
+        if completed and completion and finished > first_token_at:
+            TOKENS_PER_SECOND.observe(completion / (finished - first_token_at), provider=name, model=label)
+        # 中途断开的流同样按已生成的部分计费，不能把预扣的额度全部退还
+        usage = accumulator.usage or _estimate_usage(request, accumulator.content)
+        if app_data.limiter:
+            await app_data.limiter.settle(
+                user_id, name if name in charged else None, tokens, _usage_tokens(usage)
+            )
+        if order is not None:
+            await _record(request, order, name, model, accumulator.content, usage, interrupted=not completed)
+
+    return RelayResponse(
+        content=Relay(first, stream, app_data.config.stream.buffer_chunks, accumulator, on_finish, name),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/batch")
+async def batch(request: BatchRequest, http_request: Request):
+    user_id = get_token_payload(http_request)["sub"]
+    if len({item.id for item in request.items}) != len(request.items):
+        return FastJSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content=Response(message="批量请求中的 id 不能重复", success=False)
+        )
+
+    async def call(item: ChatRequest) -> Tuple[str, Dict[str, Any]]:
+        # 每项与单个请求一样预扣并结算用户额度，批量接口不能绕过用户限流
+        tokens = item.estimate_tokens()
+        if app_data.limiter:
+            await app_data.limiter.acquire_user(user_id, tokens)
+        charged: Set[str] = set()
+        name, result = await _chat(item, candidate_providers(item.provider), app_data.batch.limits, tokens, charged)
+        if app_data.limiter:
+            usage = result.get("usage") or _estimate_usage(item, await validate_response(result) or "")
+            await app_data.limiter.settle(user_id, name if name in charged else None, tokens, _usage_tokens(usage))
+        return name, result
+
+    async def generator():
+        async for result in app_data.batch.run(request.items, call, user_id, batch_id):
+            yield dumps(result) + b"\n"
+
+    batch_id = request.batch_id or uuid4().hex
+    return StreamingResponse(
+        content=generator(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch_id}
+    )
+
+
 @router.get("/stream_test")
 async def stream_test():
     async def generator():
@@ -20,4 +362,3 @@ async def stream_test():
         content=generator(),
         media_type="text/plain"
     )
-
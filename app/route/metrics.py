@@ -0,0 +1,23 @@
+import hmac
+
+from fastapi import APIRouter, Request
+from starlette import status
+from starlette.responses import PlainTextResponse
+
+from app.data import app_data
+from app.util import metrics
+
+router = APIRouter()
+
+
+@router.get("")
+async def export(request: Request):
+    """ Prometheus 文本格式的指标 """
+    config = app_data.config.metrics
+    if not config.enabled:
+        return PlainTextResponse("metrics disabled", status_code=status.HTTP_404_NOT_FOUND)
+    if config.token and not hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(), f"Bearer {config.token}".encode()
+    ):
+        return PlainTextResponse("unauthorized", status_code=status.HTTP_401_UNAUTHORIZED)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,83 @@
+from typing import Optional
+
+from fastapi import APIRouter, Query, Request
+from starlette import status
+
+from app.data import app_data
+from app.model import Page, Response
+from app.model.search import SearchResult, search_messages
+from app.model.session import (
+    Session, SessionCreateRequest, SessionInfo, MessageInfo,
+    list_sessions, list_messages, get_user_session
+)
+from app.util.auth import get_token_payload
+from app.util.serializer import FastJSONResponse
+
+router = APIRouter()
+
+
+@router.post("")
+async def create_session(data: SessionCreateRequest, request: Request) -> Response[SessionInfo]:
+    item = Session(user_id=get_token_payload(request)["sub"])
+    if data.title:
+        item.title = data.title
+
+    async with app_data.db.async_session() as session:
+        async with session.begin():
+            session.add(item)
+    return Response(message="创建成功", data=SessionInfo.model_validate(item))
+
+
+@router.get("")
+async def get_sessions(
+        request: Request,
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100)
+) -> Response[Page[SessionInfo]]:
+    try:
+        items, next_cursor = await list_sessions(
+            app_data.db.async_session, get_token_payload(request)["sub"], limit, cursor
+        )
+    except ValueError:
+        return FastJSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content=Response(message="无效的游标", success=False)
+        )
+    return Response(
+        message="获取成功",
+        data=Page(items=[SessionInfo.model_validate(item) for item in items], next_cursor=next_cursor)
+    )
+
+
+@router.get("/search")
+async def search(
+        request: Request,
+        q: str = Query(..., min_length=1, max_length=200),
+        cursor: int = Query(0, ge=0),
+        limit: int = Query(20, ge=1, le=100)
+) -> Response[Page[SearchResult]]:
+    items, next_cursor = await search_messages(
+        app_data.db.async_session, app_data.db.backend, get_token_payload(request)["sub"], q, limit, cursor
+    )
+    return Response(message="搜索成功", data=Page(items=items, next_cursor=next_cursor))
+
+
+@router.get("/{session_id}/messages")
+async def get_messages(
+        session_id: str,
+        request: Request,
+        cursor: Optional[int] = None,
+        limit: int = Query(50, ge=1, le=200)
+) -> Response[Page[MessageInfo]]:
+    user_id = get_token_payload(request)["sub"]
+    if await get_user_session(app_data.db.async_session, session_id, user_id) is None:
+        return FastJSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content=Response(message="会话不存在", success=False)
+        )
+
+    items, next_cursor = await list_messages(app_data.db.async_session, session_id, limit, cursor)
+    return Response(
+        message="获取成功",
+        data=Page(items=[MessageInfo.model_validate(item) for item in items], next_cursor=next_cursor)
+    )
@@ -1,25 +1,29 @@
+import asyncio
 import base64
 import datetime
 import hashlib
 import hmac
-import json
-from typing import Any, Dict, Optional, List, Callable
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, List, Tuple
 
 import bcrypt
 from fastapi import Request
 from starlette import status
-from starlette.responses import Response, JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Scope, Receive, Send
 
 from app import model
 from app.data import app_data
+from app.error.auth import HasherBusyError
 from app.logger import logger
+from app.util.cache import TTLCache
+from app.util.metrics import AUTH_DURATION, QUEUE_WAIT
+from app.util.serializer import FastJSONResponse, dumps, loads
 
 
 def _base64_encode(data):
     if isinstance(data, Dict):
-        data = json.dumps(data).encode('utf-8')
+        data = dumps(data)
     elif isinstance(data, str):
         data = data.encode('utf-8')
 
@@ -42,13 +46,48 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
-def generate_password_hash(password: str) -> str:
+def generate_password_hash(password: str, rounds: int = 12) -> str:
     """生成密码哈希"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 
+class PasswordHasher:
+    """ 在独立的有界线程池中执行 bcrypt，避免阻塞事件循环 """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 32):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, func: Callable, *args):
+        if self.pending >= self.max_pending:
+            raise HasherBusyError(self.pending)
+
+        submitted = time.perf_counter()
+
+        def job():
+            QUEUE_WAIT.observe(time.perf_counter() - submitted, queue="bcrypt")
+            return func(*args)
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, job)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(generate_password_hash, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 def generate_access_token(secret_key: str, payload: Dict[str, Any]) -> str:
     """ 生成令牌 """
     encoded_header = _base64_encode({"alg": "HS256", "typ": "JWT"})
@@ -85,12 +124,17 @@ def get_payload(secret_key: str, token: str) -> Optional[Dict[str, Any]]:
 
         payload = _base64_decode(encoded_payload)
 
-        return json.loads(payload)
+        return loads(payload)
     except Exception as e:
         logger.error(f"Failed to verify access token: {str(e)}")
         return None
 
 
+def _expire_timestamp(exp_str: str) -> float:
+    """ 将 ISO 格式的到期时间转换为时间戳，无时区信息时按本地时间处理 """
+    return datetime.datetime.fromisoformat(exp_str).timestamp()
+
+
 def verify_access_token(secret_key: str, token: str) -> Optional[Dict[str, Any]]:
     """ 验证TOKEN是否过期并且返回Payload """
     payload = get_payload(secret_key, token)
@@ -103,14 +147,7 @@ def verify_access_token(secret_key: str, token: str) -> Optional[Dict[str, Any]]
         return None
 
     try:
-        exp = datetime.datetime.fromisoformat(exp_str)
-
-        if exp.tzinfo:
-            current = datetime.datetime.now(exp.tzinfo)
-        else:
-            current = datetime.datetime.now()
-
-        if current > exp:
+        if time.time() > _expire_timestamp(exp_str):
             logger.debug(f"Token has expired: {token}")
             return None
 
@@ -121,52 +158,109 @@ def verify_access_token(secret_key: str, token: str) -> Optional[Dict[str, Any]]
     return payload
 
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, exclude_paths: List[str]):
-        super().__init__(app)
-        self.exclude_paths = exclude_paths
+class TokenCache:
+    """ 已验证令牌的缓存，按签名索引，令牌到期时淘汰 """
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        token: Optional[str] = None
-        path = request.url.path
+    def __init__(self, maxsize: int = 4096):
+        self.cache: TTLCache[Tuple[str, Dict[str, Any]]] = TTLCache(maxsize)
+
+    def verify(self, secret_key: str, token: str) -> Optional[Dict[str, Any]]:
+        """ 与 verify_access_token 相同，命中缓存时只需一次字典查找 """
+        # 签名依赖密钥，密钥轮换后旧条目不会再命中
+        key = (secret_key, token.rpartition('.')[2])
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] == token:
+            return entry[1]
 
-        for exclude_path in self.exclude_paths:
-            if path.startswith(exclude_path):
-                return await call_next(request)
+        payload = verify_access_token(secret_key, token)
+        if payload:
+            self.cache.set(key, (token, payload), expire_at=_expire_timestamp(payload['exp']))
+        return payload
 
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.replace("Bearer ", "")
+    def clear(self):
+        self.cache.clear()
+
+
+class PrefixTrie:
+    """ 前缀树，判断路径是否以任一前缀开头，与逐个 startswith 的语义一致 """
+    _END = ""
+
+    def __init__(self, prefixes: List[str]):
+        self.root: Dict[str, Dict] = {}
+        for prefix in prefixes:
+            node = self.root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[self._END] = {}
+
+    def match(self, path: str) -> bool:
+        node = self.root
+        for char in path:
+            if self._END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self._END in node
+
+
+def get_token_payload(request: Request) -> Dict[str, Any]:
+    """ 获取 AuthMiddleware 已验证的令牌 Payload """
+    return request.state.token_payload
+
+
+def _unauthorized(message: str, status_code: int = status.HTTP_401_UNAUTHORIZED) -> FastJSONResponse:
+    return FastJSONResponse(
+        status_code=status_code,
+        content=model.Response(
+            message=message,
+            success=False
+        )
+    )
+
+
+class AuthMiddleware:
+    """ 纯 ASGI 实现的认证中间件，不会包装响应体，流式响应不受影响 """
+
+    def __init__(self, app: ASGIApp, exclude_paths: List[str], cache_size: int = 4096):
+        self.app = app
+        self.exclude_paths = PrefixTrie(exclude_paths)
+        self.token_cache = TokenCache(cache_size)
+        self._secret: Optional[str] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.exclude_paths.match(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        token: Optional[str] = None
+        for key, value in scope["headers"]:
+            if key == b"authorization":
+                if value.startswith(b"Bearer "):
+                    token = value[7:].decode("latin-1")
+                break
 
         if not token:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content=model.Response(
-                    message="Invalid authentication credentials",
-                    success=False
-                ).model_dump()
-            )
+            response = _unauthorized("Invalid authentication credentials")
+            return await response(scope, receive, send)
 
+        secret = app_data.config.secret
+        if secret != self._secret:
+            # 配置热加载更换了密钥，旧密钥签发的令牌全部失效
+            self.token_cache.clear()
+            self._secret = secret
+
+        started = time.perf_counter()
         try:
-            result = verify_access_token(app_data.config.secret, token)
-            if result:
-                return await call_next(request)
+            payload = self.token_cache.verify(secret, token)
+            AUTH_DURATION.observe(time.perf_counter() - started)
         except Exception as e:
             logger.error(f"Failed to verify access token: {str(e)}")
+            response = _unauthorized("Failed to verify access token", status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return await response(scope, receive, send)
 
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content=model.Response(
-                    message="Failed to verify access token",
-                    success=False
-                ).model_dump()
-            )
-
-        return JSONResponse(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            content=model.Response(
-                    message="Invalid authentication credentials",
-                    success=False
-                ).model_dump()
-        )
+        if not payload:
+            response = _unauthorized("Invalid authentication credentials")
+            return await response(scope, receive, send)
 
+        scope.setdefault("state", {})["token_payload"] = payload
+        await self.app(scope, receive, send)
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """
+    带过期时间的 LRU 缓存。
+    超出容量时淘汰最久未使用的条目，过期条目在访问时淘汰。
+    """
+
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: Optional[float] = None,
+            timer: Callable[[], float] = time.time,
+            sizeof: Optional[Callable[[V], int]] = None
+    ):
+        """
+        参数：
+        :param maxsize: 容量上限，默认按条目数计算
+        :param ttl: 默认存活时间（秒），None 表示不过期
+        :param timer: 时钟函数，过期时间与其同一时间基准
+        :param sizeof: 计算条目大小的函数，指定后 maxsize 按其总和计算（如字节数）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def _weight(self, value: V) -> int:
+        return 1 if self.sizeof is None else self.sizeof(value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is not None:
+            expire_at, value = entry
+            if expire_at > self.timer():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            self.pop(key)
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None, expire_at: Optional[float] = None):
+        """
+        写入缓存
+        参数：
+        :param ttl: 本条目的存活时间，默认使用缓存的 ttl
+        :param expire_at: 本条目的绝对过期时间，优先于 ttl
+        """
+        if expire_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expire_at = float("inf") if ttl is None else self.timer() + ttl
+
+        self.pop(key)
+        self._data[key] = (expire_at, value)
+        self.size += self._weight(value)
+        while self.size > self.maxsize and len(self._data) > 1:
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.size -= self._weight(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self.size -= self._weight(entry[1])
+        return entry[1]
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+
+class DiskCache:
+    """
+    基于文件的缓存，每个条目一个文件，以修改时间判断过期。
+    超出 max_bytes 时按修改时间淘汰最旧的条目。方法均为同步 IO，应在线程中调用。
+    """
+
+    def __init__(self, directory: Path, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _load(self):
+        entries = []
+        for path in self.directory.glob("*/*"):
+            if path.name.endswith(".tmp"):
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.size += size
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - path.stat().st_mtime > self.ttl:
+                self.delete(key)
+                return None
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: bytes):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(value)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.size += len(value) - self._index.pop(key, 0)
+            self._index[key] = len(value)
+            evicted = self._evict()
+        for old in evicted:
+            self._path(old).unlink(missing_ok=True)
+
+    def delete(self, key: str):
+        with self._lock:
+            self.size -= self._index.pop(key, 0)
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self) -> List[str]:
+        evicted = []
+        while self.max_bytes is not None and self.size > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self.size -= size
+            evicted.append(key)
+        return evicted
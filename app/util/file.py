@@ -15,6 +15,11 @@ def get_app_path() -> str:
     return os.path.dirname(__file__)
 
 
+def load_config(path=constants.CONFIG_FILE) -> Config:
+    """ 读取并校验配置文件，为同步 IO，在事件循环中应通过线程调用 """
+    return Config(**toml.load(path))
+
+
 def new_empty_config(app_data: AppData):
     os.makedirs(constants.SAVE_DATA_DIR, exist_ok=True)
     with open(constants.CONFIG_FILE, 'w') as f:
@@ -1,65 +1,189 @@
-from PIL import Image
+import asyncio
 import base64
 import io
-import cv2
-import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
 
+# Pillow、OpenCV 与 NumPy 导入耗时较长，只在实际处理图片时（通常在进程池中）导入，不拖慢启动
 from app.logger import logger
+from app.util.cache import TTLCache, DiskCache
+from app.util.metrics import CACHE_REQUESTS
 
+_EXIF_ORIENTATION = 0x0112
+""" EXIF 方向标签 """
 
-def image_to_base64(
-        image_path: str,
-        max_size: tuple[int, int] = None,
+
+def encode_image(
+        image: Union[str, bytes],
+        max_size: Optional[Tuple[int, int]] = None,
         quality: int = 85,
         format: str = "JPEG"
 ) -> str:
     """
-    将图片转换为 Base64 字符串并支持压缩
+    解码、等比缩放、编码一次完成，不捕获异常，可在进程池中执行
 
     参数：
-    :param image_path: 图片文件路径
-    :param max_size: 最大尺寸 (宽, 高)，默认不调整大小
+    :param image: 图片文件路径或图片文件内容
+    :param max_size: 最大尺寸 (宽, 高)，按比例缩放到该范围内，不放大
     :param quality: 压缩质量 (1-100)，仅对 JPEG 有效
     :param format: 输出格式 (JPEG/PNG)
 
     返回：
     :return: Base64 编码字符串
     """
-    try:
-        # 使用 OpenCV 读取图片进行预处理和压缩
-        img_cv = cv2.imread(image_path)
-        if img_cv is None:
-            raise ValueError("无法读取图片文件")
+    from PIL import Image, ImageOps
 
-        # 调整图片尺寸
+    source = io.BytesIO(image) if isinstance(image, bytes) else image
+    with Image.open(source) as img:
+        # EXIF 方向为 5~8 时旋转 90°，宽高互换；旋转放在缩放之后，不影响 draft 的低分辨率解码
+        orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
         if max_size:
-            img_cv = cv2.resize(img_cv, max_size, interpolation=cv2.INTER_AREA)
-
-        # 转换为 RGB 模式（兼容 JPEG）
-        img_cv = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
+            box = (max_size[1], max_size[0]) if orientation in (5, 6, 7, 8) else max_size
+            # 先用 draft 让 JPEG 在解码阶段按 1/2、1/4、1/8 缩小，thumbnail 再用 reduce 粗缩放
+            img.draft("RGB", (int(box[0] * 2), int(box[1] * 2)))
+            img.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        if orientation != 1:
+            # 按 EXIF 方向旋转，否则手机拍摄的照片会横倒，且重新编码后方向信息丢失
+            ImageOps.exif_transpose(img, in_place=True)
+
+        # JPEG 不支持透明通道和调色板
+        if format == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
 
-        # 转换为 PIL 图像
-        img_pil = Image.fromarray(img_cv)
-
-        # 保存到内存缓冲区
         buffer = io.BytesIO()
-        save_args = {'format': format}
+        save_args = {'format': format, 'optimize': True}
         if format == 'JPEG':
             save_args['quality'] = quality
-            save_args['optimize'] = True
-        elif format == 'PNG':
-            save_args['optimize'] = True
+        img.save(buffer, **save_args)
 
-        img_pil.save(buffer, **save_args)
+    return base64.b64encode(buffer.getbuffer()).decode('ascii')
 
-        # 生成 Base64
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
 
+def image_to_base64(
+        image_path: str,
+        max_size: Optional[Tuple[int, int]] = None,
+        quality: int = 85,
+        format: str = "JPEG"
+) -> str:
+    """
+    将图片转换为 Base64 字符串并支持压缩
+
+    参数：
+    :param image_path: 图片文件路径
+    :param max_size: 最大尺寸 (宽, 高)，按比例缩放到该范围内，默认不调整大小
+    :param quality: 压缩质量 (1-100)，仅对 JPEG 有效
+    :param format: 输出格式 (JPEG/PNG)
+
+    返回：
+    :return: Base64 编码字符串
+    """
+    try:
+        return encode_image(image_path, max_size, quality, format)
     except Exception as e:
         logger.error(f"处理失败: {str(e)}")
         return ""
 
 
+def _read_and_hash(image_path: str) -> Tuple[bytes, str]:
+    data = Path(image_path).read_bytes()
+    return data, hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class ImageCache:
+    """ 按内容哈希索引的图片处理结果缓存：内存层 + 磁盘层，均按字节数淘汰 """
+
+    def __init__(self, directory: Path, memory_bytes: int, disk_bytes: int):
+        self.memory: TTLCache[str] = TTLCache(memory_bytes, sizeof=len)
+        self.disk = DiskCache(directory, max_bytes=disk_bytes) if disk_bytes > 0 else None
+
+    @staticmethod
+    def key(digest: str, max_size: Optional[Tuple[int, int]], quality: int, format: str) -> str:
+        size = f"{max_size[0]}x{max_size[1]}" if max_size else "orig"
+        return f"{digest}_{size}_{quality}_{format.lower()}"
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            data = await asyncio.to_thread(self.disk.get, key)
+            if data is not None:
+                value = data.decode('ascii')
+                self.memory.set(key, value)
+        CACHE_REQUESTS.inc(cache="image", result="miss" if value is None else "hit")
+        return value
+
+    async def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value.encode('ascii'))
+            except OSError as e:
+                logger.error(f"写入图片缓存失败: {str(e)}")
+
+
+class ImageProcessor:
+    """ 在进程池中处理图片，避免多图请求阻塞事件循环；进程池在首次使用时创建 """
+
+    def __init__(self, workers: int = 2, cache: Optional[ImageCache] = None):
+        self.workers = workers
+        self.cache = cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def to_base64(
+            self,
+            image_path: str,
+            max_size: Optional[Tuple[int, int]] = None,
+            quality: int = 85,
+            format: str = "JPEG"
+    ) -> str:
+        """ image_to_base64 的异步版本，相同内容与参数的图片只处理一次 """
+        loop = asyncio.get_running_loop()
+        try:
+            if self.cache is None:
+                return await loop.run_in_executor(
+                    self.executor, encode_image, image_path, max_size, quality, format
+                )
+
+            data, digest = await asyncio.to_thread(_read_and_hash, image_path)
+            key = ImageCache.key(digest, max_size, quality, format)
+            result = await self.cache.get(key)
+            if result is None:
+                result = await loop.run_in_executor(self.executor, encode_image, data, max_size, quality, format)
+                await self.cache.set(key, result)
+            return result
+        except Exception as e:
+            logger.error(f"处理失败: {str(e)}")
+            return ""
+
+    async def to_base64_many(
+            self,
+            image_paths: List[str],
+            max_size: Optional[Tuple[int, int]] = None,
+            quality: int = 85,
+            format: str = "JPEG"
+    ) -> List[str]:
+        """ 并行处理多张图片，结果顺序与输入一致 """
+        return list(await asyncio.gather(
+            *(self.to_base64(path, max_size, quality, format) for path in image_paths)
+        ))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
 def base64_to_image(base64_str: str, output_path: str):
     """
     将 Base64 字符串转换回图片并保存
@@ -72,6 +196,9 @@ def base64_to_image(base64_str: str, output_path: str):
     :return: None
     """
     try:
+        import cv2
+        import numpy as np
+
         # 解码 Base64
         img_data = base64.b64decode(base64_str)
 
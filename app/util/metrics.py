@@ -0,0 +1,208 @@
+"""
+Metrics 指标
+进程内的 Prometheus 格式指标，以及可选的 OpenTelemetry 链路追踪
+"""
+import bisect
+import math
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+""" 延迟类指标的默认分桶（秒） """
+
+REGISTRY: List["Metric"] = []
+""" 所有已注册的指标 """
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """ 逐行输出样本 """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """ 只增不减的计数器 """
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in list(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """ 可增可减的瞬时值 """
+    type = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in list(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """ 分桶统计，用于延迟、吞吐等分布 """
+    type = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            description: str,
+            labels: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+        """ 每组标签：各分桶计数（不累计），最后两项为总和与总数 """
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 3)
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(counts[-2])}"
+            yield f"{self.name}_count{labels} {int(counts[-1])}"
+
+
+def render() -> str:
+    """ 以 Prometheus 文本格式输出所有指标 """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+@lru_cache(maxsize=1)
+def _tracer() -> Optional[Any]:
+    try:
+        from opentelemetry import trace
+        return trace.get_tracer("raven-client")
+    except ImportError:
+        return None
+
+
+tracing_enabled = False
+""" 是否输出链路追踪，需要安装 opentelemetry-api 并在应用外配置导出器 """
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """ 记录一个追踪区间；未启用追踪或未安装 OpenTelemetry 时不做任何事 """
+    tracer = _tracer() if tracing_enabled else None
+    if tracer is None:
+        yield
+        return
+
+    with tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None}):
+        yield
+
+
+UPSTREAM_CONNECT = Histogram(
+    "raven_upstream_connect_seconds", "Time to open a new upstream connection", ["provider"]
+)
+UPSTREAM_ERRORS = Counter(
+    "raven_upstream_errors_total", "Failed upstream requests", ["provider", "status"]
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "raven_time_to_first_token_seconds", "Time until the first upstream stream chunk", ["provider", "model"]
+)
+REQUEST_DURATION = Histogram(
+    "raven_request_duration_seconds", "Total completion latency", ["provider", "model", "stream"]
+)
+TOKENS_PER_SECOND = Histogram(
+    "raven_stream_tokens_per_second", "Completion tokens per second of streamed responses", ["provider", "model"],
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320)
+)
+ACTIVE_STREAMS = Gauge(
+    "raven_active_streams", "Streams currently being relayed", ["provider"]
+)
+QUEUE_WAIT = Histogram(
+    "raven_queue_wait_seconds", "Time spent waiting for a worker or rate limit slot", ["queue"]
+)
+DB_WRITE = Histogram(
+    "raven_db_write_seconds", "Batched history write latency", []
+)
+DB_WRITE_ROWS = Counter(
+    "raven_db_write_rows_total", "Rows written by the history writer", ["result"]
+)
+AUTH_DURATION = Histogram(
+    "raven_auth_seconds", "Access token verification time", [],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01)
+)
+CACHE_REQUESTS = Counter(
+    "raven_cache_requests_total", "Cache lookups", ["cache", "result"]
+)
+COALESCED_REQUESTS = Counter(
+    "raven_coalesced_requests_total", "Requests served by an identical in-flight upstream call", ["kind"]
+)
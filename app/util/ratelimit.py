@@ -0,0 +1,189 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.error.llm import RateLimitExceededError, RequestTooLargeError
+from app.model.data import RateLimit
+
+
+class TokenBucket:
+    """ 令牌桶：容量为 capacity，每秒补充 rate 个令牌，检查与扣减均为 O(1) """
+
+    def __init__(self, rate: float, capacity: float, timer: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.timer = timer
+        self.tokens = capacity
+        self.updated_at = timer()
+
+    def _refill(self):
+        now = self.timer()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """ 令牌足够时扣减并返回 True，否则不扣减 """
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def wait_time(self, amount: float = 1) -> float:
+        """ 获得 amount 个令牌还需等待的秒数 """
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """ 无条件扣减，余额可以为负，用于按实际用量事后结算 """
+        self._refill()
+        self.tokens -= amount
+
+    async def acquire(self, amount: float = 1):
+        """ 等待直到获得 amount 个令牌 """
+        amount = min(amount, self.capacity)
+        while not self.try_acquire(amount):
+            await asyncio.sleep(self.wait_time(amount))
+
+
+class RateLimitStore(ABC):
+    """ 令牌桶状态的存储，可替换为跨进程共享的实现 """
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        """ 令牌足够时扣减并返回 0，否则不扣减并返回需要等待的秒数 """
+
+    @abstractmethod
+    async def consume(self, key: str, rate: float, capacity: float, amount: float):
+        """ 无条件扣减（amount 为负时为退还） """
+
+    async def close(self):
+        pass
+
+
+class LocalStore(RateLimitStore):
+    """ 进程内存储，只在单个进程内生效 """
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, key: str, rate: float, capacity: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate, capacity)
+        return bucket
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        bucket = self._bucket(key, rate, capacity)
+        if bucket.try_acquire(amount):
+            return 0.0
+        return bucket.wait_time(amount)
+
+    async def consume(self, key: str, rate: float, capacity: float, amount: float):
+        self._bucket(key, rate, capacity).consume(amount)
+
+
+class RedisStore(RateLimitStore):
+    """ Redis 兼容服务器存储，多个进程共享限流状态，需要安装 redis """
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local amount = tonumber(ARGV[3])
+    local force = ARGV[4] == "1"
+    local clock = redis.call("TIME")
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local data = redis.call("HMGET", KEYS[1], "tokens", "ts")
+    local tokens = tonumber(data[1]) or capacity
+    local ts = tonumber(data[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    local wait = 0
+    if force or tokens >= amount then
+        tokens = tokens - amount
+    else
+        wait = (amount - tokens) / rate
+    end
+    redis.call("HSET", KEYS[1], "tokens", tokens, "ts", now)
+    redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 60)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str = "raven:ratelimit:"):
+        from redis.asyncio import Redis
+
+        self.prefix = prefix
+        self.redis = Redis.from_url(url)
+        self.script = self.redis.register_script(self.SCRIPT)
+
+    async def _run(self, key: str, rate: float, capacity: float, amount: float, force: bool) -> float:
+        result = await self.script(keys=[self.prefix + key], args=[rate, capacity, amount, int(force)])
+        return float(result)
+
+    async def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        return await self._run(key, rate, capacity, amount, False)
+
+    async def consume(self, key: str, rate: float, capacity: float, amount: float):
+        await self._run(key, rate, capacity, amount, True)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+class RateLimiter:
+    """
+    按用户与提供商分别限制每分钟请求数和 token 数。
+    请求前按预估 token 数扣减，完成后按实际用量结算差额。
+    """
+
+    def __init__(self, settings: RateLimit, store: RateLimitStore):
+        self.settings = settings
+        self.store = store
+
+    async def _take(self, limits: List[Tuple[str, float, float]], scope: str):
+        """ 依次扣减多个桶，任一不足时退还已扣减的部分；超过桶容量的请求永远无法满足，直接拒绝 """
+        for _, per_minute, amount in limits:
+            if 0 < per_minute < amount:
+                raise RequestTooLargeError(scope, per_minute)
+
+        taken = []
+        for key, per_minute, amount in limits:
+            if per_minute <= 0:
+                continue
+            wait = await self.store.take(key, per_minute / 60, per_minute, amount)
+            if wait > 0:
+                for taken_key, taken_per_minute, taken_amount in taken:
+                    await self.store.consume(taken_key, taken_per_minute / 60, taken_per_minute, -taken_amount)
+                raise RateLimitExceededError(scope, wait)
+            taken.append((key, per_minute, amount))
+
+    async def acquire_user(self, user_id: str, tokens: int):
+        settings = self.settings
+        await self._take([
+            (f"user:{user_id}:rpm", settings.user_requests_per_minute, 1),
+            (f"user:{user_id}:tpm", settings.user_tokens_per_minute, tokens),
+        ], f"user '{user_id}'")
+
+    async def acquire_provider(self, provider: str, tokens: int):
+        settings = self.settings
+        await self._take([
+            (f"provider:{provider}:rpm", settings.provider_requests_per_minute, 1),
+            (f"provider:{provider}:tpm", settings.provider_tokens_per_minute, tokens),
+        ], f"provider '{provider}'")
+
+    async def settle(self, user_id: str, provider: Optional[str], estimated: int, actual: int):
+        """ 按实际 token 用量结算，多退少补 """
+        difference = actual - estimated
+        if difference == 0:
+            return
+        settings = self.settings
+        buckets = [(f"user:{user_id}:tpm", settings.user_tokens_per_minute)]
+        if provider:
+            buckets.append((f"provider:{provider}:tpm", settings.provider_tokens_per_minute))
+        for key, per_minute in buckets:
+            if per_minute > 0:
+                await self.store.consume(key, per_minute / 60, per_minute, difference)
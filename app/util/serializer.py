@@ -0,0 +1,45 @@
+"""
+Serializer 序列化
+JSON 编解码的统一入口：安装了 orjson 时使用 orjson，否则回退到标准库 json
+"""
+import json
+from typing import Any, Union
+
+import pydantic_core
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    # datetime、UUID 等由 pydantic 转换为 JSON 兼容的值
+    return pydantic_core.to_jsonable_python(value)
+
+
+def dumps(value: Any) -> bytes:
+    """ 序列化为紧凑的 UTF-8 JSON """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """ 解析 JSON，无法解析时抛出 ValueError """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """ 使用 dumps 编码的 JSON 响应，pydantic 模型直接序列化为字节而不经过中间字典 """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return pydantic_core.to_json(content)
+        return dumps(content)
@@ -0,0 +1,85 @@
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+from app.util.cache import TTLCache
+
+
+class SharedStore(ABC):
+    """ 请求之间共享的键值存储（消息顺序号、结果缓存等），可替换为跨进程共享的实现 """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """ 读取键的值，不存在或已过期时返回 None """
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        """ 写入键的值，ttl 为 None 时不过期 """
+
+    @abstractmethod
+    async def add(self, key: str, value: int, ttl: Optional[float] = None) -> bool:
+        """ 键不存在时写入，返回是否写入 """
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """ 原子地增加计数并返回增加后的值，键不存在时从 0 开始；ttl 每次都会刷新 """
+
+    async def close(self):
+        pass
+
+
+class LocalSharedStore(SharedStore):
+    """ 进程内存储，只在单个进程内共享 """
+
+    def __init__(self, maxsize: int = 100000):
+        self.cache: TTLCache[Any] = TTLCache(maxsize)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.cache.get(key, count=False)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.cache.set(key, value, ttl)
+
+    async def add(self, key: str, value: int, ttl: Optional[float] = None) -> bool:
+        if key in self.cache:
+            return False
+        self.cache.set(key, value, ttl)
+        return True
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = int(self.cache.get(key, 0, count=False)) + amount
+        self.cache.set(key, value, ttl)
+        return value
+
+
+class RedisSharedStore(SharedStore):
+    """ Redis 兼容服务器存储，多个工作进程共享，需要安装 redis """
+
+    def __init__(self, url: str, prefix: str = "raven:"):
+        from redis.asyncio import Redis
+
+        self.prefix = prefix
+        self.redis = Redis.from_url(url)
+
+    @staticmethod
+    def _ms(ttl: Optional[float]) -> Optional[int]:
+        return None if ttl is None else max(1, int(ttl * 1000))
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await self.redis.set(self.prefix + key, value, px=self._ms(ttl))
+
+    async def add(self, key: str, value: int, ttl: Optional[float] = None) -> bool:
+        return bool(await self.redis.set(self.prefix + key, value, px=self._ms(ttl), nx=True))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(self.prefix + key, amount)
+            if ttl is not None:
+                pipe.pexpire(self.prefix + key, self._ms(ttl))
+            value, *_ = await pipe.execute()
+        return int(value)
+
+    async def close(self):
+        await self.redis.aclose()
@@ -0,0 +1,37 @@
+import re
+from functools import lru_cache
+from typing import Any, Optional
+
+MESSAGE_OVERHEAD = 4
+""" 每条消息的角色、分隔符等固定开销 """
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[Any]:
+    """ 安装了 tiktoken 时使用 cl100k_base 精确计数，否则返回 None """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """ 计算文本的 token 数；没有 tiktoken 时按 CJK 字符 1 个、其它字符 4 个一个 token 估算 """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(content: Any) -> int:
+    """ 计算一条消息的 token 数，非文本内容（如图片）按固定值估算 """
+    if isinstance(content, str):
+        return count_tokens(content) + MESSAGE_OVERHEAD
+    return 256 + MESSAGE_OVERHEAD
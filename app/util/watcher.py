@@ -0,0 +1,91 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+
+import toml
+from pydantic import ValidationError
+
+from app.logger import logger
+from app.model.data import Config
+from app.util.file import load_config
+
+
+class ConfigWatcher:
+    """
+    配置文件监视器。
+    定期检查文件的修改时间与大小，变化后在线程中重新解析并校验，校验通过才交给 on_change；
+    文件为空或解析失败时保留当前配置。
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            interval: float,
+            on_change: Callable[[Config], Awaitable[None]],
+            settle: float = 0.2
+    ):
+        """
+        参数：
+        :param settle: 发现变化后等待文件稳定的时间（秒），避免读到编辑器写了一半的文件
+        """
+        self.path = Path(path)
+        self.interval = interval
+        self.on_change = on_change
+        self.settle = settle
+        self._last: Optional[Tuple[int, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        if self._task is None:
+            self._last = self._stat()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def check(self) -> bool:
+        """ 检查一次文件是否变化，返回是否应用了新配置 """
+        stat = await asyncio.to_thread(self._stat)
+        if stat is None or stat == self._last:
+            return False
+        await asyncio.sleep(self.settle)
+        if await asyncio.to_thread(self._stat) != stat:
+            # 仍在写入，下次检查时再读取
+            return False
+        self._last = stat
+        if stat[1] == 0:
+            logger.warning("配置文件为空，继续使用当前配置")
+            return False
+
+        try:
+            config = await asyncio.to_thread(load_config, self.path)
+        except (OSError, toml.TomlDecodeError, ValidationError) as e:
+            logger.error(f"配置文件无效，继续使用当前配置: {str(e)}")
+            return False
+
+        try:
+            await self.on_change(config)
+        except Exception as e:
+            logger.error(f"应用新配置失败: {str(e)}")
+            return False
+        logger.info(f"Config reloaded from {self.path}")
+        return True
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
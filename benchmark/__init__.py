@@ -0,0 +1,4 @@
+"""
+Benchmark 压测
+基于本地模拟上游的性能测试，用法见 python -m benchmark --help
+"""
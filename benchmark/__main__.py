@@ -0,0 +1,178 @@
+"""
+Benchmark 压测
+启动模拟上游与 app.main:app（uvicorn 子进程，使用临时 HOME 下的独立配置与数据库），依次运行各场景并输出 JSON 报告
+
+python -m benchmark                                  # 运行全部场景
+python -m benchmark --scenarios stream --concurrency 100 --token-rate 30
+python -m benchmark --baseline benchmark/results/old.json --threshold 0.15
+python -m benchmark --scenarios startup --import-budget 1500
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import toml
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+from benchmark import mock_provider, report, scenarios
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _write_config(home: Path, provider_port: int, args: argparse.Namespace):
+    directory = home / ".config" / "raven-client"
+    directory.mkdir(parents=True, exist_ok=True)
+    config = {
+        "secret": "benchmark-secret",
+        "database": {"type": "sqlite"},
+        "providers": {
+            "mock": {
+                "enabled": True,
+                "api_key": "mock",
+                "base_url": f"http://127.0.0.1:{provider_port}/v1",
+                "default_model": "mock",
+            }
+        },
+        "security": {"bcrypt_rounds": args.bcrypt_rounds},
+        # 限流与结果缓存会掩盖被测路径的真实开销
+        "ratelimit": {"enabled": False},
+        "cache": {"enabled": False},
+    }
+    (directory / "config.toml").write_text(toml.dumps(config), encoding="utf-8")
+
+
+async def _start_server(home: Path, port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, "HOME": str(home)},
+    )
+    async with ClientSession(timeout=ClientTimeout(total=1)) as client:
+        for _ in range(100):
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn 退出，返回码 {server.returncode}")
+            try:
+                async with client.get(f"http://127.0.0.1:{port}/openapi.json") as response:
+                    if response.status == 200:
+                        return server
+            except (ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn 启动超时")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    home = Path(tempfile.mkdtemp(prefix="raven-bench-"))
+    # 进程内场景导入 app 时使用同一个临时目录，不影响真实的用户数据
+    os.environ["HOME"] = str(home)
+
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    result = report.new_report(parameters)
+    selected = args.scenarios.split(",")
+    settings = mock_provider.MockSettings(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+    )
+    provider = await mock_provider.start(settings)
+    provider_port = provider.addresses[0][1]
+    options = {
+        "concurrency": args.concurrency,
+        "provider_url": f"http://127.0.0.1:{provider_port}/v1/chat/completions",
+        "database_url": f"sqlite+aiosqlite:///{home}/benchmark.db",
+    }
+
+    try:
+        http = [name for name in selected if name in scenarios.HTTP_SCENARIOS]
+        if http:
+            _write_config(home, provider_port, args)
+            port = _free_port()
+            server = await _start_server(home, port)
+            try:
+                async with ClientSession(f"http://127.0.0.1:{port}") as client:
+                    options["token"] = await scenarios.login_token(client)
+                    for name in http:
+                        total = args.logins if name == "login" else args.requests
+                        concurrency = min(args.concurrency, args.login_concurrency) if name == "login" else args.concurrency
+                        print(f"running {name} ...", file=sys.stderr)
+                        result["scenarios"][name] = await scenarios.HTTP_SCENARIOS[name](
+                            client, **{**options, "total": total, "concurrency": concurrency}
+                        )
+            finally:
+                server.terminate()
+                server.wait()
+
+        for name in selected:
+            if name in scenarios.LOCAL_SCENARIOS:
+                print(f"running {name} ...", file=sys.stderr)
+                total = {"db": args.rows, "startup": args.startup_runs}.get(name, args.requests)
+                result["scenarios"][name] = await scenarios.LOCAL_SCENARIOS[name](**{**options, "total": total})
+    finally:
+        await provider.cleanup()
+    return result
+
+
+def main():
+    all_scenarios = ",".join([*scenarios.HTTP_SCENARIOS, *scenarios.LOCAL_SCENARIOS])
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="raven-client 压测")
+    parser.add_argument("--scenarios", default=all_scenarios, help=f"逗号分隔，可选 {all_scenarios}")
+    parser.add_argument("--requests", type=int, default=500, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发数")
+    parser.add_argument("--logins", type=int, default=100, help="登录场景的请求数")
+    parser.add_argument("--login-concurrency", type=int, default=16, help="登录场景的并发数，受 hash_queue_size 限制")
+    parser.add_argument("--rows", type=int, default=5000, help="db 场景写入的对话轮数")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟上游首 token 延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0, help="模拟上游每秒 token 数，0 为不限速")
+    parser.add_argument("--tokens", type=int, default=64, help="模拟上游每个回复的 token 数")
+    parser.add_argument("--error-rate", type=float, default=0, help="模拟上游返回 503 的比例")
+    parser.add_argument("--startup-runs", type=int, default=5, help="startup 场景导入 app.main 的次数，取最小值")
+    parser.add_argument("--import-budget", type=float, help="app.main 导入耗时上限（毫秒），超出或导入了重型依赖时返回码为 1")
+    parser.add_argument("--output", type=Path, help="报告路径，默认 benchmark/results/<时间>.json")
+    parser.add_argument("--baseline", type=Path, help="与之对比的基线报告，退化超过阈值时返回码为 1")
+    parser.add_argument("--threshold", type=float, default=0.1, help="允许的相对退化比例")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    output = args.output or ROOT / "benchmark" / "results" / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    report.save(result, output)
+    print(json.dumps(result["scenarios"], indent=2, ensure_ascii=False))
+    print(f"report saved to {output}", file=sys.stderr)
+
+    failed = False
+    startup = result["scenarios"].get("startup")
+    if args.import_budget is not None and startup:
+        if startup["import_ms"] > args.import_budget:
+            print(f"OVER BUDGET import app.main: {startup['import_ms']}ms > {args.import_budget}ms", file=sys.stderr)
+            failed = True
+        if startup["eager_modules"]:
+            print(f"OVER BUDGET eagerly imported: {', '.join(startup['eager_modules'])}", file=sys.stderr)
+            failed = True
+
+    if args.baseline:
+        regressions = report.compare(json.loads(args.baseline.read_text(encoding="utf-8")), result, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        failed = failed or bool(regressions)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
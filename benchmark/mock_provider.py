@@ -0,0 +1,98 @@
+"""
+Mock Provider 模拟上游
+OpenAI 兼容的本地模拟服务，可配置首字延迟、生成速率与错误注入
+
+单独运行：python -m benchmark.mock_provider --port 8765 --latency 0.2 --token-rate 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class MockSettings:
+    latency: float = 0.05
+    """ 首个 token 之前的延迟（秒） """
+    token_rate: float = 0
+    """ 每秒生成的 token 数，0 表示不限速 """
+    tokens: int = 64
+    """ 每个回复的 token 数 """
+    error_rate: float = 0
+    """ 返回错误的请求比例 """
+    error_status: int = 503
+    """ 注入错误时返回的状态码 """
+
+
+def _chunk(data) -> bytes:
+    return b"data: " + json.dumps(data).encode() + b"\n\n"
+
+
+def create_app(settings: MockSettings) -> web.Application:
+    interval = 1 / settings.token_rate if settings.token_rate > 0 else 0
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        if settings.error_rate and random.random() < settings.error_rate:
+            return web.json_response({"error": {"message": "injected error"}}, status=settings.error_status)
+
+        await asyncio.sleep(settings.latency)
+        usage = {"prompt_tokens": len(json.dumps(body.get("messages", []))) // 4, "completion_tokens": settings.tokens}
+
+        if not body.get("stream"):
+            await asyncio.sleep(interval * settings.tokens)
+            return web.json_response({
+                "id": "mock",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "tok " * settings.tokens}}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        started = time.perf_counter()
+        for i in range(settings.tokens):
+            # 按绝对时间对齐，避免 sleep 误差累积导致速率偏低
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await response.write(_chunk({"choices": [{"index": 0, "delta": {"content": "tok "}}]}))
+        await response.write(_chunk({"choices": [], "usage": usage}))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+
+async def start(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+    """ 在当前事件循环中启动模拟服务，port 为 0 时随机分配，实际端口见 runner.addresses """
+    runner = web.AppRunner(create_app(settings), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的模拟上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=MockSettings.latency)
+    parser.add_argument("--token-rate", type=float, default=MockSettings.token_rate)
+    parser.add_argument("--tokens", type=int, default=MockSettings.tokens)
+    parser.add_argument("--error-rate", type=float, default=MockSettings.error_rate)
+    parser.add_argument("--error-status", type=int, default=MockSettings.error_status)
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency, args.token_rate, args.tokens, args.error_rate, args.error_status)
+    web.run_app(create_app(settings), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
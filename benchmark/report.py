@@ -0,0 +1,97 @@
+"""
+Report 报告
+统计延迟分布、生成 JSON 报告，并与基线报告对比
+"""
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+HIGHER_IS_BETTER = ("per_second", "throughput")
+""" 名称包含这些片段的指标越大越好，其余（延迟、错误数）越小越好 """
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """ 延迟分布（毫秒） """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def new_report(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "scenarios": {},
+    }
+
+
+def save(report: Dict[str, Any], path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    对比两份报告
+    参数：
+    :param threshold: 允许的相对退化比例，如 0.1 表示 10%
+    返回：
+    :return: 退化超过阈值的指标说明
+    """
+    old = _flatten(baseline["scenarios"])
+    new = _flatten(current["scenarios"])
+    regressions = []
+    for name, before in old.items():
+        after = new.get(name)
+        if after is None or name.endswith(("requests", "concurrency", "rows")):
+            continue
+        if name.endswith("errors"):
+            if after > before:
+                regressions.append(f"{name}: {before} -> {after}")
+            continue
+        if not before:
+            continue
+        change = (after - before) / before
+        if any(part in name for part in HIGHER_IS_BETTER):
+            change = -change
+        if change > threshold:
+            regressions.append(f"{name}: {before} -> {after} ({change:+.1%})")
+    return regressions
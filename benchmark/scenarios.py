@@ -0,0 +1,257 @@
+"""
+Scenarios 压测场景
+HTTP 场景通过真实的 uvicorn 进程访问 app.main:app；db 与 post_request 场景在当前进程内直接调用，
+startup 场景在新进程中用 -X importtime 测量导入耗时
+"""
+import asyncio
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiohttp import ClientSession
+
+from benchmark.report import summarize
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("cv2", "numpy", "PIL")
+""" 只在处理图片时使用，启动时不应导入的重型依赖 """
+
+
+async def drive(total: int, concurrency: int, call: Callable[[int], Awaitable[Any]]) -> Tuple[List[Any], int, float]:
+    """
+    以固定并发执行 total 次 call
+    返回：
+    :return: (成功调用的返回值, 失败次数, 总耗时)
+    """
+    results, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            try:
+                results.append(await call(i))
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    return results, errors, time.perf_counter() - started
+
+
+def _throughput(results: List[Any], errors: int, elapsed: float, concurrency: int) -> Dict[str, Any]:
+    return {
+        "requests": len(results) + errors,
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_second": round(len(results) / elapsed, 2) if elapsed else 0,
+    }
+
+
+async def login_token(client: ClientSession) -> str:
+    await client.post("/auth/register", json={"username": USERNAME, "password": PASSWORD, "email": "bench@example.com"})
+    async with client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD}) as response:
+        data = await response.json()
+    if not data.get("success"):
+        raise RuntimeError(f"登录失败：{data.get('message')}")
+    return data["data"]["token"]
+
+
+async def login(client: ClientSession, total: int, concurrency: int, **_) -> Dict[str, Any]:
+    """ 登录吞吐量，主要成本为 bcrypt 校验 """
+    await login_token(client)
+
+    async def call(_: int) -> float:
+        started = time.perf_counter()
+        async with client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD}) as response:
+            data = await response.json()
+        if not data.get("success"):
+            raise RuntimeError(data.get("message"))
+        return time.perf_counter() - started
+
+    results, errors, elapsed = await drive(total, concurrency, call)
+    return {**_throughput(results, errors, elapsed, concurrency), "latency": summarize(results)}
+
+
+async def auth(client: ClientSession, total: int, concurrency: int, token: str, **_) -> Dict[str, Any]:
+    """
+    鉴权开销：同样以 404 结束的请求，分别走需要鉴权的路径和免鉴权的路径，差值即 AuthMiddleware 的成本
+    """
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def request(path: str, with_token: bool) -> Callable[[int], Awaitable[float]]:
+        async def call(_: int) -> float:
+            started = time.perf_counter()
+            async with client.get(path, headers=headers if with_token else None) as response:
+                await response.read()
+            if response.status != 404:
+                raise RuntimeError(f"unexpected status {response.status}")
+            return time.perf_counter() - started
+        return call
+
+    authenticated, auth_errors, auth_elapsed = await drive(total, concurrency, request("/llm/__bench__", True))
+    excluded, excluded_errors, excluded_elapsed = await drive(total, concurrency, request("/metrics/__bench__", False))
+    authenticated_latency, excluded_latency = summarize(authenticated), summarize(excluded)
+    return {
+        "authenticated": {
+            **_throughput(authenticated, auth_errors, auth_elapsed, concurrency), "latency": authenticated_latency
+        },
+        "excluded": {
+            **_throughput(excluded, excluded_errors, excluded_elapsed, concurrency), "latency": excluded_latency
+        },
+        "overhead_ms": round(authenticated_latency.get("p50_ms", 0) - excluded_latency.get("p50_ms", 0), 3),
+    }
+
+
+def _chat_body(stream: bool) -> Dict[str, Any]:
+    return {
+        "provider": "mock",
+        "stream": stream,
+        "messages": [{"role": "user", "content": "Benchmark prompt, please reply with some tokens."}],
+    }
+
+
+async def stream(client: ClientSession, total: int, concurrency: int, token: str, **_) -> Dict[str, Any]:
+    """ N 路并发流式请求的首 token 延迟与生成速率 """
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def call(_: int) -> Tuple[float, float, int]:
+        started = time.perf_counter()
+        first, tokens = None, 0
+        async with client.post("/llm/chat/completions", headers=headers, json=_chat_body(True)) as response:
+            if response.status != 200:
+                raise RuntimeError(f"unexpected status {response.status}")
+            async for line in response.content:
+                if b'"delta"' in line:
+                    first = first or time.perf_counter()
+                    tokens += 1
+        finished = time.perf_counter()
+        if first is None:
+            raise RuntimeError("empty stream")
+        return first - started, finished - started, tokens / (finished - first) if finished > first else 0
+
+    results, errors, elapsed = await drive(total, concurrency, call)
+    rates = [rate for _, _, rate in results if rate]
+    return {
+        **_throughput(results, errors, elapsed, concurrency),
+        "ttft": summarize([ttft for ttft, _, _ in results]),
+        "duration": summarize([duration for _, duration, _ in results]),
+        "tokens_per_second": round(sum(rates) / len(rates), 2) if rates else 0,
+    }
+
+
+async def completion(client: ClientSession, total: int, concurrency: int, token: str, **_) -> Dict[str, Any]:
+    """ 非流式请求的端到端延迟 """
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def call(_: int) -> float:
+        started = time.perf_counter()
+        async with client.post("/llm/chat/completions", headers=headers, json=_chat_body(False)) as response:
+            data = await response.json()
+        if not data.get("success"):
+            raise RuntimeError(data.get("message"))
+        return time.perf_counter() - started
+
+    results, errors, elapsed = await drive(total, concurrency, call)
+    return {**_throughput(results, errors, elapsed, concurrency), "latency": summarize(results)}
+
+
+async def post_request(total: int, concurrency: int, provider_url: str, **_) -> Dict[str, Any]:
+    """ app.llm.openai.post_request 直连模拟上游，使用复用的连接池 """
+    from app.llm.openai import post_request as call_api
+
+    async with ClientSession() as session:
+        async def call(_: int) -> float:
+            started = time.perf_counter()
+            reply = await call_api("Benchmark prompt", provider_url, "mock", "mock", session=session, cache=False)
+            if reply is None:
+                raise RuntimeError("empty reply")
+            return time.perf_counter() - started
+
+        results, errors, elapsed = await drive(total, concurrency, call)
+    return {**_throughput(results, errors, elapsed, concurrency), "latency": summarize(results)}
+
+
+async def db(total: int, database_url: str, **_) -> Dict[str, Any]:
+    """ 写后队列写入对话记录的速率，total 为对话轮数（每轮两行） """
+    from app.model import metadata, add_missing_columns, create_indexes
+    from app.model.data import DatabaseManager, History
+    from app.model.session import Session, new_chat_histories, touch_sessions
+    from app.model.writer import BatchWriter
+
+    manager = DatabaseManager(database_url)
+    async with manager.engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        await conn.run_sync(create_indexes)
+
+    async with manager.async_session() as session:
+        chat = Session(user_id="bench")
+        session.add(chat)
+        await session.commit()
+
+    settings = History()
+    writer = BatchWriter(
+        manager.async_session,
+        flush_interval=settings.flush_interval_ms / 1000,
+        batch_size=settings.batch_size,
+        max_queue=settings.max_queue,
+        on_flush=touch_sessions
+    )
+    writer.start()
+    usage = {"prompt_tokens": 12, "completion_tokens": 64}
+    started = time.perf_counter()
+    for i in range(total):
+        await writer.put(*new_chat_histories(
+            chat.id, i * 2, {"role": "user", "content": f"Benchmark prompt {i}"},
+            "tok " * 64, "mock", usage, {"provider": "mock"}
+        ))
+    enqueued = time.perf_counter() - started
+    await writer.close()
+    elapsed = time.perf_counter() - started
+    await manager.engine.dispose()
+    return {
+        "rows": total * 2,
+        "enqueue_ms": round(enqueued * 1000, 3),
+        "rows_per_second": round(total * 2 / elapsed, 2) if elapsed else 0,
+    }
+
+
+def _import_times(module: str) -> Dict[str, int]:
+    """ 在新进程中导入 module，返回 -X importtime 输出的各模块累计耗时（微秒） """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    times = {}
+    for line in output.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+async def startup(total: int, **_) -> Dict[str, Any]:
+    """ 冷启动导入 app.main 的耗时，取 total 次中的最小值；errors 为启动时被导入的重型依赖数 """
+    runs = [await asyncio.to_thread(_import_times, "app.main") for _ in range(total)]
+    best = min(runs, key=lambda times: times["app.main"])
+    eager = [name for name in HEAVY_MODULES if name in best]
+    packages = sorted(
+        ((name, round(us / 1000, 1)) for name, us in best.items() if "." not in name and name != "app"),
+        key=lambda item: item[1],
+        reverse=True
+    )
+    return {
+        "import_ms": round(best["app.main"] / 1000, 3),
+        "errors": len(eager),
+        "eager_modules": eager,
+        "slowest_packages": packages[:10],
+    }
+
+
+HTTP_SCENARIOS = {"login": login, "auth": auth, "stream": stream, "completion": completion}
+LOCAL_SCENARIOS = {"post_request": post_request, "db": db, "startup": startup}